@@ -0,0 +1,176 @@
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class AlphaBeta():
+    """
+    Depth-limited alpha-beta search over State.next, deepened iteratively under a
+    time limit. One ply is one agent action: the agents of a player move one after
+    the other, then the other player moves, as in State.next.
+    Nodes of the root player maximize, the other ones minimize
+    scores[root player] - scores[opponent].
+
+    get_action() needs the State object, e.g. env.get_state(return_object=True).
+    """
+    def __init__(self, n_actions: int = 13, num_agents: int = 2, time_limit: float = 1.0,
+                 max_depth: int = 64, tt_size: int = 200000, weights=None) -> None:
+        self.n_actions = n_actions
+        self.num_agents = num_agents
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.tt_size = tt_size
+        # (wall, castle, territory) weights of the evaluation, the state's own alpha/beta/gamma if None
+        self.weights = weights
+        self.table = OrderedDict()
+        self.nodes = 0
+        self.completed_depth = 0
+
+    def get_action(self, state, epsilon=0.0):
+        action = None
+        for action in self.iter_actions(state):
+            pass
+        return action
+
+    def iter_actions(self, state, deadline=None):
+        """
+        Yields the best action after each completed depth, until the time limit,
+        the deadline (time.perf_counter() value) or max_depth is reached.
+        """
+        if isinstance(state, Mapping):
+            raise TypeError('AlphaBeta searches the State object, use env.get_state(return_object=True)')
+        if deadline is None:
+            deadline = time.perf_counter() + self.time_limit
+        root = state.clone()
+        root.players = None
+        if root.current_player != getattr(self, 'root_player', None):
+            # stored values are relative to the root player
+            self.table.clear()
+        self.root_player = root.current_player
+        self.deadline = deadline
+        self.nodes = 0
+        self.completed_depth = 0
+        actions = self.ordered_actions(root, None)
+        yield actions[0]
+        if len(actions) == 1:
+            return
+        max_depth = min(self.max_depth, self.remaining_plies(root))
+        for depth in range(1, max_depth + 1):
+            try:
+                _, action = self.search(root, depth, float('-inf'), float('inf'))
+            except SearchTimeout:
+                return
+            self.completed_depth = depth
+            yield action
+
+    def remaining_plies(self, state):
+        return (state.remaining_turns * state.num_players - state.current_player) * state.num_agents \
+            - state.agent_current_idx
+
+    def evaluate(self, state):
+        player = self.root_player
+        if self.weights is None:
+            scores = state.scores
+            return scores[player] - scores[1 - player]
+        alpha, beta, gamma = self.weights
+        value = 0
+        for p, sign in ((player, 1), (1 - player, -1)):
+            value += sign * (alpha * state.wall_scores[p] + beta * state.castle_scores[p] +
+                             gamma * state.territory_scores[p])
+        return value
+
+    def key(self, state):
+        return hash((state.board.tobytes(),
+                     state.current_player, state.agent_current_idx, state.remaining_turns))
+
+    def ordered_actions(self, state, tt_action):
+        """
+        Valid actions, best first: the transposition table move, then wall changes
+        and moves ranked by the number of own walls around the target cell, which
+        favours closing territories. 'Stay' if nothing is valid.
+        Ties in the search keep the first action, so the order also breaks them.
+        """
+        valid = state.get_valid_actions()
+        x, y = state.get_curr_agent()
+        walls = state.walls[state.current_player]
+        height, width = walls.shape
+        n_moves = len(state.move_offsets)
+        offsets = list(state.move_offsets) + list(state.change_offsets)
+        ranked = []
+        for action in range(len(offsets)):
+            if not valid[action]:
+                continue
+            tx, ty = x + offsets[action][0], y + offsets[action][1]
+            linked = walls[max(tx - 1, 0):tx + 2, max(ty - 1, 0):ty + 2].sum()
+            ranked.append((action < n_moves, -linked, action))
+        if not ranked:
+            return [state.n_actions - 1]
+        actions = [action for _, _, action in sorted(ranked)]
+        if tt_action in actions:
+            actions.remove(tt_action)
+            actions.insert(0, tt_action)
+        return actions
+
+    def store(self, key, entry):
+        table = self.table
+        table[key] = entry
+        table.move_to_end(key)
+        if len(table) > self.tt_size:
+            table.popitem(last=False)
+
+    def search(self, state, depth, alpha, beta):
+        self.nodes += 1
+        # a node costs far more than the clock read, so the deadline is checked on every node
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if depth == 0 or state.is_terminal():
+            return self.evaluate(state), None
+
+        key = self.key(state)
+        entry = self.table.get(key)
+        tt_action = None
+        if entry is not None:
+            entry_depth, value, flag, tt_action = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value, tt_action
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                elif flag == UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value, tt_action
+
+        alpha_0, beta_0 = alpha, beta
+        maximizing = state.current_player == self.root_player
+        best_value = float('-inf') if maximizing else float('inf')
+        best_action = None
+        for action in self.ordered_actions(state, tt_action):
+            child = state.clone()
+            child.next(action)
+            value, _ = self.search(child, depth - 1, alpha, beta)
+            if maximizing:
+                if value > best_value:
+                    best_value, best_action = value, action
+                alpha = max(alpha, value)
+            else:
+                if value < best_value:
+                    best_value, best_action = value, action
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= alpha_0:
+            flag = UPPER
+        elif best_value >= beta_0:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.store(key, (depth, best_value, flag, best_action))
+        return best_value, best_action
@@ -0,0 +1,259 @@
+import random
+import threading
+import time
+import multiprocessing
+from collections import deque
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class RandomValid():
+    """
+    Cheap default fallback: a random valid action, 'Stay' if none is valid
+    """
+    def __init__(self, n_actions: int = 13) -> None:
+        self.n_actions = n_actions
+
+    def get_action(self, state, epsilon=0.0):
+        if not isinstance(state, Mapping):
+            state = state.get_state()
+        valid = np.flatnonzero(state['valid_actions'])
+        if len(valid) == 0:
+            return self.n_actions - 1
+        return int(np.random.choice(valid))
+
+
+class TimingStats():
+    """
+    timeouts: decisions without a move of the agent at the deadline (an
+    anytime search that yielded nothing, or another agent that did not
+    return); expiries: anytime searches stopped by the deadline after
+    yielding a move, their normal end
+    """
+    def __init__(self, window: int = 1000) -> None:
+        self.calls = 0
+        self.timeouts = 0
+        self.expiries = 0
+        self.fallbacks = 0
+        self.restarts = 0
+        self.times = deque(maxlen=window)
+        self.updates = deque(maxlen=window)
+
+    def record(self, elapsed, updates, timed_out, expired, fallback):
+        self.calls += 1
+        self.timeouts += timed_out
+        self.expiries += expired
+        self.fallbacks += fallback
+        self.times.append(elapsed)
+        self.updates.append(updates)
+
+    def summary(self):
+        times = np.array(self.times) if self.times else np.zeros(1)
+        return {
+            'calls': self.calls,
+            'timeouts': self.timeouts,
+            'expiries': self.expiries,
+            'fallbacks': self.fallbacks,
+            'restarts': self.restarts,
+            'mean_time': float(times.mean()),
+            'p95_time': float(np.percentile(times, 95)),
+            'max_time': float(times.max()),
+            'mean_updates': float(np.mean(self.updates)) if self.updates else 0.0,
+        }
+
+
+# small map of the warm-up search
+WARMUP_MAP = {'height-min': 8, 'height-max': 8, 'width-min': 8, 'width-max': 8,
+              'min-num-agents': 2, 'max-num-agents': 2, 'min-num-turns': 2, 'max-num-turns': 2,
+              'num-castles': 3, 'num-ponds': 3, 'obs_range': 3}
+
+
+def warm_up(agent, budget=0.05):
+    """
+    Compiles the kernels and runs a throwaway search of an anytime agent, so
+    the first real decision does not pay the lazy imports and the JIT
+    compilation (which hold the GIL). The global random states are restored.
+    """
+    from src import kernels
+    kernels.precompile()
+    if not hasattr(agent, 'iter_actions'):
+        return
+    from src.state import State
+    from src.match import ACTION_SPACE
+    states = random.getstate(), np.random.get_state()
+    try:
+        state = State(WARMUP_MAP, action_space=ACTION_SPACE)
+        state.make_random_map()
+        for _ in agent.iter_actions(state, time.perf_counter() + budget):
+            pass
+    finally:
+        random.setstate(states[0])
+        np.random.set_state(states[1])
+
+
+def _process_worker(conn, agent):
+    warm_up(agent)
+    conn.send(('ready', None))
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        state, budget = message
+        deadline = time.perf_counter() + budget
+        if hasattr(agent, 'iter_actions'):
+            for action in agent.iter_actions(state, deadline):
+                conn.send(('action', action))
+        else:
+            conn.send(('action', agent.get_action(state)))
+        conn.send(('done', None))
+
+
+class Anytime():
+    """
+    Runs an agent under a hard deadline per decision.
+
+    Agents with iter_actions(state, deadline) (e.g. AlphaBeta) are anytime:
+    the last action they yielded before the deadline is played. Other agents
+    are run through get_action(state) and the fallback agent decides if they
+    miss the deadline.
+
+    mode='thread' runs the agent in a thread of this process: it shares the
+    agent's memory but an overrunning search cannot be stopped, the fallback
+    plays until it finishes. mode='process' runs it in a worker process that
+    is restarted if it overruns, so the deadline holds for any agent.
+
+    :param time_limit: seconds per decision
+    :param margin: seconds kept for the overhead of returning the action
+    :param fallback: agent used on timeout, RandomValid by default
+    :param grace: seconds of the next decision spent waiting for an overrunning anytime search to stop
+    :param warmup: warm the agent up (see warm_up()) when the wrapper is created, in process mode
+        the worker is started and its warm-up waited for
+    """
+    def __init__(self, agent, time_limit: float = 1.0, margin: float = 0.02, fallback=None,
+                 mode: str = 'thread', grace: float = 0.05, warmup: bool = True) -> None:
+        if mode not in ('thread', 'process'):
+            raise ValueError('unknown mode: {}'.format(mode))
+        self.agent = agent
+        self.time_limit = time_limit
+        self.margin = margin
+        self.fallback = fallback or RandomValid(getattr(agent, 'n_actions', 13))
+        self.mode = mode
+        self.grace = grace
+        self.stats = TimingStats()
+        self._thread = None
+        self._process = None
+        self._conn = None
+        self._busy = False
+        if warmup:
+            # the fallback runs in this process in both modes
+            warm_up(agent if mode == 'thread' else self.fallback)
+            if mode == 'process':
+                self._start_process()
+                self._conn.recv()
+
+    def get_action(self, state, epsilon=0.0):
+        start = time.perf_counter()
+        deadline = start + self.time_limit - self.margin
+        if self.mode == 'thread':
+            action, updates, finished = self._run_thread(state, deadline)
+        else:
+            action, updates, finished = self._run_process(state, deadline)
+        # no move of the agent at the deadline; an anytime search stopped by
+        # the deadline after yielding a move is not a timeout
+        timed_out = action is None
+        expired = not finished and not timed_out
+        if timed_out:
+            action = self.fallback.get_action(state)
+        self.stats.record(time.perf_counter() - start, updates, timed_out, expired, timed_out)
+        return action
+
+    def _run_thread(self, state, deadline):
+        if self._thread is not None and self._thread.is_alive():
+            # the previous search overran, anytime agents stop right after their deadline
+            self._thread.join(min(self.grace, max(0.0, deadline - time.perf_counter())))
+            if self._thread.is_alive():
+                return None, 0, False
+        result = []
+        done = threading.Event()
+        agent = self.agent
+
+        def run():
+            try:
+                if hasattr(agent, 'iter_actions'):
+                    for action in agent.iter_actions(state, deadline):
+                        result.append(action)
+                else:
+                    result.append(agent.get_action(state))
+            finally:
+                done.set()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        finished = done.wait(max(0.0, deadline - time.perf_counter()))
+        return (result[-1] if result else None), len(result), finished
+
+    def _start_process(self):
+        ctx = multiprocessing.get_context()
+        self._conn, child = ctx.Pipe()
+        self._process = ctx.Process(target=_process_worker, args=(child, self.agent), daemon=True)
+        self._process.start()
+        child.close()
+
+    def _stop_process(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._conn.close()
+            self._process = None
+            self._conn = None
+
+    def _drain(self, deadline):
+        """
+        Reads the actions sent by the worker until its 'done' or the deadline
+        """
+        actions = []
+        while True:
+            remaining = deadline - time.perf_counter()
+            if not self._conn.poll(max(0.0, remaining)):
+                return actions, False
+            kind, value = self._conn.recv()
+            if kind == 'ready':
+                continue
+            if kind == 'done':
+                return actions, True
+            actions.append(value)
+
+    def _run_process(self, state, deadline):
+        if self._busy:
+            # the previous search overran, anytime agents stop right after their deadline
+            _, finished = self._drain(min(time.perf_counter() + self.grace, deadline))
+            if not finished:
+                self._stop_process()
+                self.stats.restarts += 1
+            self._busy = False
+        if self._process is None:
+            self._start_process()
+        self._conn.send((state, deadline - time.perf_counter()))
+        actions, finished = self._drain(deadline)
+        if not finished:
+            if hasattr(self.agent, 'iter_actions'):
+                self._busy = True
+            else:
+                self._stop_process()
+                self.stats.restarts += 1
+        return (actions[-1] if actions else None), len(actions), finished
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self._stop_process()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -1,10 +1,34 @@
 import random
 import numpy as np
 
+# hand-tuned constants of the heuristic, see src/sweep.py to tune them
+DEFAULT_WEIGHTS = {
+    'move_own_territory': -0.1,     # moving onto own territory
+    'move_wall_adjacent': 0.5,      # per own wall next to the target cell (if not closed in)
+    'move_border': -0.25,           # per neighbour of the target cell on the edge of the view
+    'move_pond': -0.15,             # per pond next to the target cell
+    'move_castle': -0.05,           # per castle next to the target cell
+    'move_wall_diagonal': 0.5,      # per own wall diagonal to the target cell
+    'move_future_territory': 0.2,
+    'move_opponent_territory': 0.1,
+    'change': 1,                    # base score of a Change action
+    'change_wall_adjacent': 2.1,    # per own wall next to the changed cell
+    'change_wall_diagonal': 2.9,    # per own wall diagonal to the changed cell
+    'stay': -0.9,
+}
+
+
 class StupidMove():
-    def __init__(self, n_actions: int = 4, num_agents: int = 2) -> None:
+    def __init__(self, n_actions: int = 4, num_agents: int = 2, weights=None) -> None:
         self.n_actions = n_actions
         self.num_agents = num_agents
+        # DEFAULT_WEIGHTS, updated with the given ones
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            unknown = set(weights) - set(DEFAULT_WEIGHTS)
+            if unknown:
+                raise ValueError('unknown StupidMove weights: {}'.format(sorted(unknown)))
+            self.weights.update(weights)
         
         self.action_space = {
             'Move': ['U', 'D', 'L', 'R', 'UL', 'UR', 'DL', 'DR'],
@@ -41,6 +65,7 @@ class StupidMove():
         
         
     def get_action(self, state, epsilon=0.0):
+        w = self.weights
         current_player_id = state['player-id']
         current_agent_id = state['current-agent-id']
         agent_board = state['observation'][[0, 3]]
@@ -59,7 +84,7 @@ class StupidMove():
                 x, y = self.direction_map[self.action_space['Move'][i]]
                 new_x, new_y = x + curr_x, y + curr_y
                 if territory_board[0][new_x, new_y] == 1:
-                    score = -0.1
+                    score = w['move_own_territory']
                 elif wall_board[0][new_x, new_y] + wall_board[1][new_x, new_y] + \
                     pond_board[new_x, new_y] + castle_board[new_x, new_y] == 0 and \
                         masked[new_x, new_y] == True:
@@ -84,7 +109,8 @@ class StupidMove():
                             if castle_board[new_x + dx[j], new_y + dy[j]] == 1:
                                 cnt_castle += 1
                                 
-                    score += (cnt_wall + cnt_bounder + cnt_pond + cnt_castle < 4) * cnt_wall * 0.5 - cnt_bounder * 0.25 - cnt_pond * 0.15 - cnt_castle * 0.05
+                    score += (cnt_wall + cnt_bounder + cnt_pond + cnt_castle < 4) * cnt_wall * w['move_wall_adjacent'] + \
+                        cnt_bounder * w['move_border'] + cnt_pond * w['move_pond'] + cnt_castle * w['move_castle']
                     
                     dx = [1, 1, -1, -1]
                     dy = [1, -1, 1, -1]
@@ -93,19 +119,19 @@ class StupidMove():
                         if new_x + dx[j] >= 0 and new_x + dx[j] < obs_size[0] and \
                             new_y + dy[j] >= 0 and new_y + dy[j] < obs_size[1]:
                             if wall_board[0][new_x + dx[j], new_y + dy[j]] == 1:
-                                score += 0.5
+                                score += w['move_wall_diagonal']
                     # +0.1 for future territory
                     if territory_board[0][new_x, new_y] == 1:
-                        score += 0.2
+                        score += w['move_future_territory']
                     
                     if territory_board[1][new_x, new_y] == 1:
-                        score += 0.1 # need to damage territory's opponent in the future
+                        score += w['move_opponent_territory'] # need to damage territory's opponent in the future
                         
                 scores[i] = score
             
         for j in range(len(self.action_space['Change'])):
             if valid_actions[self.action_map[('Change', self.action_space['Change'][j])]]:
-                score = 1
+                score = w['change']
                 x, y = self.direction_map[self.action_space['Change'][j]]
                 new_x, new_y = x + curr_x, y + curr_y
                 
@@ -115,7 +141,7 @@ class StupidMove():
                     if new_x + dx[k] >= 0 and new_x + dx[k] < obs_size[0] and \
                         new_y + dy[k] >= 0 and new_y + dy[k] < obs_size[1]:
                         if wall_board[0][new_x + dx[k], new_y + dy[k]] == 1:
-                            score += 2.1
+                            score += w['change_wall_adjacent']
                                     
                 dx = [1, 1, -1, -1]
                 dy = [1, -1, 1, -1]
@@ -124,11 +150,11 @@ class StupidMove():
                     if new_x + dx[k] >= 0 and new_x + dx[k] < obs_size[0] and \
                         new_y + dy[k] >= 0 and new_y + dy[k] < obs_size[1]:
                         if wall_board[0][new_x + dx[k], new_y + dy[k]] == 1:
-                            score += 2.9
+                            score += w['change_wall_diagonal']
                                         
                 scores[len(self.action_space['Move']) + j] = score
             
-        scores[-1] = -0.9
+        scores[-1] = w['stay']
         max_score = max(scores)
         max_score_actions = [i for i in range(len(scores)) if scores[i] == max_score]
         action = random.choice(max_score_actions)
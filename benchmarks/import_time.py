@@ -0,0 +1,63 @@
+"""
+Import-time benchmark of the simulation core.
+
+Imports each core module in a fresh interpreter, reports the best wall time
+over a few runs and fails (exit code 1) if a heavy optional dependency gets
+imported or if the import takes longer than the budget.
+
+Usage: python benchmarks/import_time.py [--budget 0.5] [--runs 5]
+"""
+import json
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CORE_MODULES = ['src.map', 'src.state', 'src.environment', 'src.utils']
+# must not be imported by the core, they are loaded on first use
+HEAVY_MODULES = ['pygame', 'torch', 'matplotlib', 'numba']
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'time': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure(module, runs):
+    best, heavy = None, []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        best = result['time'] if best is None else min(best, result['time'])
+        heavy = result['heavy']
+    return best, heavy
+
+
+def argument_parser():
+    parser = ArgumentParser()
+    parser.add_argument('--budget', type=float, default=0.5,
+                        help='Maximum import time of each core module, in seconds')
+    parser.add_argument('--runs', type=int, default=5)
+    return parser.parse_args()
+
+
+def main():
+    args = argument_parser()
+    failed = False
+    for module in CORE_MODULES:
+        elapsed, heavy = measure(module, args.runs)
+        ok = elapsed <= args.budget and not heavy
+        failed |= not ok
+        print('{:<20} {:7.1f} ms  {}{}'.format(module, elapsed * 1000, 'ok' if ok else 'FAIL',
+                                                '  imports ' + ', '.join(heavy) if heavy else ''))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
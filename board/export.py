@@ -0,0 +1,127 @@
+"""
+Offline export of recorded games (see src/recorder.py) to GIFs or PNG sequences.
+
+Frames are rendered by Screen on SDL's dummy video driver, so no display is
+needed, and the games are spread over a process pool: each worker renders
+whole games, which lets Screen redraw only the cells that changed between
+consecutive frames.
+
+Usage: python -m board.export games/*.npz --out reports --format gif --workers 8
+"""
+import os
+import glob
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from src.recorder import EpisodeReplayer
+
+
+def _headless():
+    # must be set before pygame initializes its display
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+
+_screen = None
+
+
+def get_screen():
+    """
+    One headless Screen per process, reused across games
+    """
+    global _screen
+    if _screen is None:
+        _headless()
+        from board.screen import Screen
+        _screen = Screen(render=True)
+    return _screen
+
+
+def render_frames(replayer, start=0, stop=None, stride=1):
+    """
+    Yields (step, RGB array of shape (height, width, 3)) for every stride-th
+    frame of a replayer, plus the last one
+    """
+    screen = get_screen()
+    import pygame
+    last = len(replayer) - 1 if stop is None else min(stop, len(replayer)) - 1
+    first = True
+    for frame in replayer.frames(start, stop):
+        if first:
+            screen.init(frame)
+            first = False
+        else:
+            screen.load_state(frame)
+        if (frame.step - start) % stride == 0 or frame.step == last:
+            # surfarray is indexed (x, y), images are (row, column)
+            yield frame.step, pygame.surfarray.array3d(screen.screen).transpose(1, 0, 2)
+
+
+def export_game(path, out_dir, fmt='gif', stride=1, duration=100, scale=1.0):
+    """
+    Renders one recorded game, returns the written path (GIF) or directory (PNG sequence)
+    """
+    from PIL import Image
+    replayer = EpisodeReplayer.load(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    images = []
+    if fmt == 'png':
+        target = os.path.join(out_dir, name)
+        os.makedirs(target, exist_ok=True)
+    else:
+        target = os.path.join(out_dir, name + '.gif')
+    for step, pixels in render_frames(replayer, stride=stride):
+        image = Image.fromarray(np.ascontiguousarray(pixels))
+        if scale != 1.0:
+            image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+        if fmt == 'png':
+            image.save(os.path.join(target, '{:05d}.png'.format(step)))
+        else:
+            images.append(image.convert('P', palette=Image.ADAPTIVE))
+    if fmt == 'gif' and images:
+        images[0].save(target, save_all=True, append_images=images[1:], duration=duration, loop=0)
+    return target
+
+
+def export_games(paths, out_dir, fmt='gif', stride=1, duration=100, scale=1.0, workers=None):
+    """
+    Exports several games in parallel, yields (path, output) as they complete.
+    workers=0 renders in the current process.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if workers == 0:
+        for path in paths:
+            yield path, export_game(path, out_dir, fmt, stride, duration, scale)
+        return
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_headless) as pool:
+        futures = {pool.submit(export_game, path, out_dir, fmt, stride, duration, scale): path
+                   for path in paths}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def argument_parser():
+    parser = ArgumentParser()
+    parser.add_argument('games', nargs='+', help='Recorded games (.npz from EpisodeRecorder.save), globs allowed')
+    parser.add_argument('--out', default='reports')
+    parser.add_argument('--format', choices=['gif', 'png'], default='gif')
+    parser.add_argument('--stride', type=int, default=1, help='Keep one frame out of stride')
+    parser.add_argument('--duration', type=int, default=100, help='GIF frame duration, in ms')
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = argument_parser()
+    paths = sorted(set(p for pattern in args.games for p in (glob.glob(pattern) or [pattern])))
+    for path, output in export_games(paths, args.out, args.format, args.stride, args.duration,
+                                     args.scale, args.workers):
+        print('{} -> {}'.format(path, output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Fixed-shape batches of observations over maps of different sizes.
+
+Every observation is padded to the largest map of the configs (see
+State.get_state(padded=True)), so one preallocated batch serves a whole
+curriculum over map sizes. The board is aligned on the top-left corner of
+the padded grid: padded coordinates are board coordinates, the board size
+of each slot is kept to tell real cells from padding.
+
+    batch = PaddedBatch.from_env(env, batch_size=64, partial=False)
+    batch.write(i, env.state, reward, done)
+    x, y = batch.board_coords(i, flat_index)   # e.g. argmax of a per-cell policy head
+"""
+import numpy as np
+
+
+class PaddedBatch(object):
+    """
+    :param obs_shape: padded observation shape, State.padded_shape(partial, features)
+    :param partial: whether slots hold partial (agent-centred) or full-board observations
+    :param features: whether observations include the feature planes (see src/features.py)
+    """
+    def __init__(self, batch_size, obs_shape, n_actions, partial=False, features=False):
+        self.batch_size = batch_size
+        self.obs_shape = tuple(obs_shape)
+        self.n_actions = n_actions
+        self.partial = partial
+        self.features = features
+        self.observations = np.full((batch_size,) + self.obs_shape, -1, dtype=np.int8)
+        self.observations[:, 8] = 0
+        self.valid_actions = np.zeros((batch_size, n_actions), dtype=bool)
+        self.rewards = np.zeros(batch_size, dtype=np.float32)
+        self.dones = np.zeros(batch_size, dtype=bool)
+        # board (height, width) and current agent (x, y) of each slot
+        self.board_sizes = np.zeros((batch_size, 2), dtype=np.int32)
+        self.agents_xy = np.zeros((batch_size, 2), dtype=np.int32)
+
+    @classmethod
+    def from_env(cls, env, batch_size, partial=False, features=False):
+        """
+        Allocates a batch fitting every map size of the configs of an AgentFighting env
+        """
+        return cls(batch_size, env.state.padded_shape(partial, features), env.n_actions,
+                   partial=partial, features=features)
+
+    def __len__(self):
+        return self.batch_size
+
+    def write(self, index, state, reward=0.0, done=False):
+        """
+        Writes the padded observation of a State into slot `index`
+        """
+        view = state.get_state(partial=self.partial, padded=True, features=self.features)
+        self.observations[index] = view['observation']
+        self.valid_actions[index] = view['valid_actions']
+        self.rewards[index] = reward
+        self.dones[index] = done
+        self.board_sizes[index] = state.height, state.width
+        self.agents_xy[index] = view['curr_agent_xy']
+
+    def write_batch(self, states, rewards=None, dones=None, start=0):
+        """
+        Writes consecutive slots starting at `start`, returns the index after the last one
+        """
+        index = start
+        for i, state in enumerate(states):
+            self.write(index, state,
+                       reward=0.0 if rewards is None else rewards[i],
+                       done=False if dones is None else dones[i])
+            index += 1
+        return index
+
+    def validity(self):
+        """
+        (batch_size, H, W) boolean mask of the cells on the board
+        """
+        return self.observations[:, 8] == 1
+
+    def board_coords(self, index, flat):
+        """
+        Board coordinates of a flat cell index of the padded full-board grid of
+        slot `index`, None if the cell is padding
+        """
+        if self.partial:
+            raise ValueError('board coordinates are only defined for full-board batches')
+        width = self.obs_shape[-1]
+        x, y = divmod(int(flat), width)
+        height_i, width_i = self.board_sizes[index]
+        if x < height_i and y < width_i:
+            return x, y
+        return None
+
+    def crop(self, index):
+        """
+        Observation of slot `index` without its padding
+        """
+        height, width = self.board_sizes[index]
+        if self.partial:
+            # windows are clipped to boards smaller than them
+            height, width = min(height, self.obs_shape[-2]), min(width, self.obs_shape[-1])
+        return self.observations[index, :, :height, :width]
@@ -0,0 +1,144 @@
+"""
+Asynchronous, atomic checkpoint writing.
+
+save() snapshots the checkpoint on the calling thread (tensors are copied to
+CPU, so training can keep updating them) and hands it to a background thread
+that serializes it into a temp file of the target directory, fsyncs it and
+renames it into place, so a crash never leaves a truncated checkpoint.
+Only the `keep_last` most recent checkpoints are kept, the best model is a
+hard link to its checkpoint instead of a copy.
+
+    writer = CheckpointWriter('checkpoints', keep_last=5)
+    writer.save({'model': net.state_dict(), 'optim': optim.state_dict()}, episode, is_best)
+    ...
+    writer.close()
+"""
+import copy
+import os
+import sys
+import shutil
+import tempfile
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def snapshot(state):
+    """
+    Copy of a checkpoint that no longer shares memory with the training state:
+    tensors are detached and copied to CPU, dicts, lists and tuples (and their
+    subclasses) are rebuilt, anything else is deep-copied
+    """
+    torch = sys.modules.get('torch')
+    if torch is not None and isinstance(state, torch.Tensor):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        items = [(key, snapshot(value)) for key, value in state.items()]
+        if isinstance(state, defaultdict):
+            return type(state)(state.default_factory, items)
+        return type(state)(items)
+    if isinstance(state, (list, tuple)):
+        items = [snapshot(value) for value in state]
+        if isinstance(state, tuple) and hasattr(state, '_fields'):
+            # namedtuple
+            return type(state)(*items)
+        return type(state)(items)
+    return copy.deepcopy(state)
+
+
+def torch_save(state, f):
+    from src.utils import get_torch
+    get_torch().save(state, f)
+
+
+class CheckpointWriter(object):
+    """
+    :param directory: where checkpoints are written, created if missing
+    :param keep_last: number of checkpoints kept on disk, None keeps them all
+    :param pattern: file name of a checkpoint, formatted with episode=...
+    :param best_name: file name of the best model, a hard link to a checkpoint
+    :param max_pending: number of snapshots queued before save() blocks
+    :param serializer: function(state, file object), torch.save by default
+    """
+    def __init__(self, directory='.', keep_last=5, pattern='checkpoint-{episode:08d}.pth.tar',
+                 best_name='model_best.pth.tar', max_pending=2, serializer=torch_save):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.pattern = pattern
+        self.best_name = best_name
+        self.max_pending = max_pending
+        self.serializer = serializer
+        self.written = deque()
+        self.pending = deque()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint')
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, state, episode, is_best=False):
+        """
+        Queues a checkpoint and returns a Future of its path. Errors of earlier
+        writes are raised here.
+        """
+        self._reap(self.max_pending - 1)
+        future = self.executor.submit(self._write, snapshot(state), episode, is_best)
+        self.pending.append(future)
+        return future
+
+    def _reap(self, limit):
+        # waits until at most `limit` writes are pending, raising their errors
+        while len(self.pending) > max(limit, 0):
+            self.pending.popleft().result()
+        while self.pending and self.pending[0].done():
+            self.pending.popleft().result()
+
+    def _write(self, state, episode, is_best):
+        path = os.path.join(self.directory, self.pattern.format(episode=episode))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self.serializer(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        if is_best:
+            self._link_best(path)
+        if path in self.written:
+            self.written.remove(path)
+        self.written.append(path)
+        while self.keep_last is not None and len(self.written) > self.keep_last:
+            old = self.written.popleft()
+            if os.path.exists(old):
+                os.remove(old)
+        return path
+
+    def _link_best(self, path):
+        best = os.path.join(self.directory, self.best_name)
+        tmp = os.path.join(self.directory, '.tmp-' + self.best_name)
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(path, tmp)
+        except OSError:
+            # file systems without hard links
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, best)
+
+    def flush(self):
+        """
+        Waits for all queued checkpoints to be on disk
+        """
+        self._reap(0)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
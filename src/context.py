@@ -0,0 +1,129 @@
+"""
+Global context of a State: coarse maps of the whole board.
+
+The partial observation only covers obs_range cells around the agent. The
+context pools the board into a g x g grid of regions for each scale g and
+gives, per region, the fraction of its cells holding (channels seen by the
+observing player, like the layers of get_state()):
+    agents, walls, territories, agents_opponent, walls_opponent,
+    territories_opponent, castles, ponds, current_agent
+current_agent is 1 in the region of the agent to move, so the local crop
+can be placed on the coarse maps.
+
+Region sums come from summed-area tables: T[x, y] is the sum of the cells
+above and left of (x, y), the sum of a region is
+T[x1, y1] - T[x0, y1] - T[x1, y0] + T[x0, y0], O(1) whatever its size. The
+tables of a dynamic layer are rebuilt only when State.layer_versions says
+the layer changed, the static ones once per map. Context maps have the same
+shape on every map size.
+"""
+import numpy as np
+
+from src.map import Map
+
+CONTEXT_CHANNELS = ('agents', 'walls', 'territories', 'agents_opponent', 'walls_opponent', 'territories_opponent',
+                    'castles', 'ponds', 'current_agent')
+# rows of SummedAreaTables.tables in the CONTEXT_CHANNELS order of each player
+PERSPECTIVE_ORDER = (np.arange(8), np.array([3, 4, 5, 0, 1, 2, 6, 7]))
+
+
+def integral(layers, out=None):
+    """
+    Summed-area tables (..., H + 1, W + 1) of (..., H, W) layers, zero first row and column
+    """
+    shape = layers.shape[:-2] + (layers.shape[-2] + 1, layers.shape[-1] + 1)
+    if out is None:
+        out = np.zeros(shape, dtype=np.int32)
+    out[..., 0, :] = 0
+    out[..., :, 0] = 0
+    np.cumsum(layers, axis=-2, dtype=np.int32, out=out[..., 1:, 1:])
+    np.cumsum(out[..., 1:, 1:], axis=-1, out=out[..., 1:, 1:])
+    return out
+
+
+def grid_edges(size, n):
+    """
+    Boundaries of n regions of (nearly) equal length over size cells, regions are empty if n > size
+    """
+    return np.floor(np.arange(n + 1) * size / n).astype(np.int64)
+
+
+def region_corners(height, width, n):
+    """
+    Flat indices into (height + 1, width + 1) tables of the 4 corners of the
+    regions of an n x n grid (4 * n * n, corner-major), the area of the
+    regions and the grid row / column of every board row / column
+    """
+    rows, cols = grid_edges(height, n), grid_edges(width, n)
+    r0, r1, c0, c1 = rows[:-1, None], rows[1:, None], cols[None, :-1], cols[None, 1:]
+    corners = np.stack([r1 * (width + 1) + c1, r0 * (width + 1) + c1,
+                        r1 * (width + 1) + c0, r0 * (width + 1) + c0]).reshape(-1)
+    area = np.maximum((r1 - r0) * (c1 - c0), 1).reshape(-1)
+    row_of = np.searchsorted(rows, np.arange(height), side='right') - 1
+    col_of = np.searchsorted(cols, np.arange(width), side='right') - 1
+    return corners, area, row_of, col_of
+
+
+def region_sums(tables, corners):
+    """
+    Sums of the regions of region_corners() over flattened summed-area tables (k, (H + 1) * (W + 1))
+    """
+    values = np.take(tables, corners, axis=1).reshape(len(tables), 4, -1)
+    return values[:, 0] - values[:, 1] - values[:, 2] + values[:, 3]
+
+
+class SummedAreaTables(object):
+    """
+    Use State.context_tables() to get the tables of a state, kept in sync with its layers.
+    """
+    def __init__(self, state):
+        self.height, self.width = state.height, state.width
+        n_layers = len(Map.BOARD_LAYERS)
+        # tables of the layers [player 0, player 1] x [agents, walls, territories], then castles and ponds
+        self.tables = np.zeros((2 * n_layers + 2, self.height + 1, self.width + 1), dtype=np.int32)
+        self.board_tables = self.tables[:2 * n_layers].reshape(2, n_layers, self.height + 1, self.width + 1)
+        integral(np.stack([state.castles, state.ponds]), out=self.tables[2 * n_layers:])
+        self.versions = [None] * n_layers
+        # region_corners() of each grid size
+        self.grids = {}
+        self.sync(state)
+
+    def sync(self, state):
+        for i, name in enumerate(Map.BOARD_LAYERS):
+            version = state.layer_versions[name]
+            if self.versions[i] != version:
+                integral(state.board[:, i], out=self.board_tables[:, i])
+                self.versions[i] = version
+        return self
+
+    def copy(self):
+        tables = object.__new__(SummedAreaTables)
+        tables.height, tables.width = self.height, self.width
+        tables.tables = self.tables.copy()
+        tables.board_tables = tables.tables[:2 * len(Map.BOARD_LAYERS)].reshape(self.board_tables.shape)
+        tables.versions = list(self.versions)
+        tables.grids = self.grids
+        return tables
+
+    def _grid(self, n):
+        grid = self.grids.get(n)
+        if grid is None:
+            grid = self.grids[n] = region_corners(self.height, self.width, n)
+        return grid
+
+    def pooled(self, n, player, agent=None, out=None):
+        """
+        (9, n, n) float32 fractions of the cells of each region, CONTEXT_CHANNELS order
+        :param agent: (x, y) of the current agent
+        """
+        if out is None:
+            out = np.zeros((len(CONTEXT_CHANNELS), n, n), dtype=np.float32)
+        corners, area, row_of, col_of = self._grid(n)
+        sums = region_sums(self.tables.reshape(len(self.tables), -1), corners)
+        flat = out.reshape(len(CONTEXT_CHANNELS), n * n)
+        np.divide(sums[PERSPECTIVE_ORDER[player]], area, out=flat[:8])
+        flat[8] = 0
+        if agent is not None:
+            x, y = agent
+            out[8, row_of[x], col_of[y]] = 1
+        return out
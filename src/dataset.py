@@ -0,0 +1,343 @@
+"""
+Offline game dataset: compressed shards with a random-access index.
+
+Layout of a dataset directory:
+    meta.json          fields (name, dtype, shape), block and shard sizes
+    shard-00000.bin    zlib blocks of block_size samples, shard_size samples per shard
+    index.npy          one row per sample: game, turn, agent, player and the
+                       shard, byte offset, length and row of its block
+A block stores its fields one after the other ((n, *shape) arrays, in the
+order of meta.json), so decoding is one zlib.decompress and a frombuffer
+per field. Samples are the dicts of arrays of src/selfplay.py.
+
+    with DatasetWriter('data/corpus') as writer:
+        for samples in generate(...):
+            writer.write(samples)
+
+    dataset = Dataset('data/corpus')
+    dataset.get(dataset.lookup(game=12, turn=3))
+    with DataLoader(dataset, 256, augment='random', symmetry=env.symmetry, workers=8) as loader:
+        for batch in loader:
+            ...
+
+The loader reads whole blocks: an epoch visits the blocks in random order,
+`blocks_per_task` blocks at a time are decompressed, shuffled together and
+augmented by worker processes, and at most `prefetch` tasks are in flight.
+The worker pool lives for one epoch, it is closed when the iteration ends
+or is abandoned.
+"""
+import os
+import json
+import zlib
+import multiprocessing
+from collections import deque
+
+import numpy as np
+
+from src.selfplay import augment_samples
+
+INDEX_DTYPE = np.dtype([('game', np.int64), ('turn', np.int16), ('agent', np.int8), ('player', np.int8),
+                        ('shard', np.int32), ('offset', np.int64), ('length', np.int32), ('row', np.int32)])
+DEFAULT_BLOCK_SIZE = 256
+
+
+def _shard_path(root, shard):
+    return os.path.join(root, 'shard-{:05d}.bin'.format(shard))
+
+
+class DatasetWriter(object):
+    """
+    :param shard_size: samples per shard file, a multiple of block_size
+    :param block_size: samples per compressed block, the unit of reads
+    :param level: zlib compression level
+    """
+    def __init__(self, root, shard_size=1 << 16, block_size=DEFAULT_BLOCK_SIZE, level=1):
+        if shard_size % block_size:
+            raise ValueError('shard_size must be a multiple of block_size')
+        if os.path.exists(os.path.join(root, 'index.npy')):
+            raise FileExistsError('a dataset already exists in {}'.format(root))
+        self.root = root
+        self.shard_size = shard_size
+        self.block_size = block_size
+        self.level = level
+        self.fields = None
+        self.buffer = None
+        self.fill = 0
+        self.shard = 0
+        self.shard_fill = 0
+        self.file = None
+        self.offset = 0
+        self.index = []
+        self.n_samples = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _allocate(self, samples):
+        self.fields = [(field, value.dtype, value.shape[1:]) for field, value in samples.items()]
+        self.buffer = {field: np.zeros((self.block_size,) + shape, dtype=dtype)
+                       for field, dtype, shape in self.fields}
+
+    def write(self, samples):
+        if self.buffer is None:
+            self._allocate(samples)
+        n = len(samples['action'])
+        start = 0
+        while start < n:
+            count = min(n - start, self.block_size - self.fill)
+            for field, _, _ in self.fields:
+                self.buffer[field][self.fill:self.fill + count] = samples[field][start:start + count]
+            self.fill += count
+            start += count
+            if self.fill == self.block_size:
+                self._write_block()
+
+    def _write_block(self):
+        n = self.fill
+        if n == 0:
+            return
+        if self.file is None:
+            self.file = open(_shard_path(self.root, self.shard), 'wb')
+            self.offset = 0
+        data = zlib.compress(b''.join(self.buffer[field][:n].tobytes() for field, _, _ in self.fields), self.level)
+        self.file.write(data)
+        entries = np.zeros(n, dtype=INDEX_DTYPE)
+        for field in ('game', 'turn', 'agent', 'player'):
+            entries[field] = self.buffer[field][:n]
+        entries['shard'] = self.shard
+        entries['offset'] = self.offset
+        entries['length'] = len(data)
+        entries['row'] = np.arange(n)
+        self.index.append(entries)
+        self.offset += len(data)
+        self.n_samples += n
+        self.fill = 0
+        self.shard_fill += n
+        if self.shard_fill >= self.shard_size:
+            self.file.close()
+            self.file = None
+            self.shard += 1
+            self.shard_fill = 0
+
+    def close(self):
+        self._write_block()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.fields is None:
+            return
+        meta = {
+            'fields': [[field, dtype.str, list(shape)] for field, dtype, shape in self.fields],
+            'block_size': self.block_size,
+            'shard_size': self.shard_size,
+            'n_samples': self.n_samples,
+        }
+        with open(os.path.join(self.root, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+        # the index is written last, a dataset without one is incomplete
+        tmp = os.path.join(self.root, 'index.tmp.npy')
+        np.save(tmp, np.concatenate(self.index) if self.index else np.zeros(0, dtype=INDEX_DTYPE))
+        os.replace(tmp, os.path.join(self.root, 'index.npy'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Dataset(object):
+    """
+    Random access to the samples of a dataset written by DatasetWriter
+    """
+    def __init__(self, root, mmap_index=True):
+        self.root = root
+        with open(os.path.join(root, 'meta.json')) as f:
+            meta = json.load(f)
+        self.fields = [(field, np.dtype(dtype), tuple(shape)) for field, dtype, shape in meta['fields']]
+        self.block_size = meta['block_size']
+        self.index = np.load(os.path.join(root, 'index.npy'), mmap_mode='r' if mmap_index else None)
+        # blocks in file order: shard, offset, length and first sample
+        starts = np.flatnonzero(self.index['row'] == 0)
+        self.blocks = np.stack([self.index['shard'][starts], self.index['offset'][starts],
+                                self.index['length'][starts], starts], axis=1).astype(np.int64)
+        self.block_of = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(self.index))))
+        self._files = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def n_blocks(self):
+        return len(self.blocks)
+
+    def _fd(self, shard):
+        fd = self._files.get(shard)
+        if fd is None:
+            fd = self._files[shard] = os.open(_shard_path(self.root, shard), os.O_RDONLY)
+        return fd
+
+    def read_block(self, block):
+        """
+        Samples of a block, as a dict of arrays
+        """
+        shard, offset, length, start = self.blocks[block]
+        n = (self.blocks[block + 1, 3] if block + 1 < len(self.blocks) else len(self.index)) - start
+        data = zlib.decompress(os.pread(self._fd(int(shard)), int(length), int(offset)))
+        samples = {}
+        position = 0
+        for field, dtype, shape in self.fields:
+            count = n * int(np.prod(shape, dtype=np.int64))
+            samples[field] = np.frombuffer(data, dtype=dtype, count=count, offset=position).reshape((n,) + shape)
+            position += count * dtype.itemsize
+        return samples
+
+    def read_blocks(self, blocks):
+        parts = [self.read_block(block) for block in blocks]
+        return {field: np.concatenate([part[field] for part in parts]) for field, _, _ in self.fields}
+
+    def lookup(self, game, turn=None, agent=None):
+        """
+        Positions of the samples of a game, optionally of one turn and agent
+        """
+        mask = self.index['game'] == game
+        if turn is not None:
+            mask &= self.index['turn'] == turn
+        if agent is not None:
+            mask &= self.index['agent'] == agent
+        return np.flatnonzero(mask)
+
+    def get(self, positions):
+        """
+        Samples at the given positions, in that order; each block is decoded once
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        blocks = self.block_of[positions]
+        out = {field: np.zeros((len(positions),) + shape, dtype=dtype) for field, dtype, shape in self.fields}
+        for block in np.unique(blocks):
+            where = np.flatnonzero(blocks == block)
+            rows = self.index['row'][positions[where]]
+            samples = self.read_block(block)
+            for field in out:
+                out[field][where] = samples[field][rows]
+        return out
+
+    def __getitem__(self, position):
+        samples = self.get([position])
+        return {field: value[0] for field, value in samples.items()}
+
+    def close(self):
+        for fd in self._files.values():
+            os.close(fd)
+        self._files = {}
+
+
+_worker_dataset = None
+
+
+def _loader_init(root):
+    # each worker maps the index and opens the shards itself
+    global _worker_dataset
+    _worker_dataset = Dataset(root)
+
+
+def _load_task(blocks, seed, shuffle, augment, symmetry, dataset=None):
+    """
+    Decodes, shuffles and augments a group of blocks
+    """
+    dataset = dataset or _worker_dataset
+    samples = dataset.read_blocks(blocks)
+    rng = np.random.RandomState(seed)
+    if shuffle:
+        order = rng.permutation(len(samples['action']))
+        samples = {field: value[order] for field, value in samples.items()}
+    return augment_samples(samples, symmetry, augment, rng=rng)
+
+
+class DataLoader(object):
+    """
+    Batches over a Dataset, one epoch per iteration.
+    :param augment: 'none', 'random' or 'all' (see src.selfplay.augment_samples)
+    :param symmetry: the Symmetry of the action layout (e.g. env.symmetry), needed to augment
+    :param blocks_per_task: blocks decoded and shuffled together by a worker
+    :param workers: worker processes, 0 to decode in the current process
+    :param prefetch: tasks in flight, default 2 per worker
+    """
+    def __init__(self, dataset, batch_size, shuffle=True, augment='none', symmetry=None, blocks_per_task=8,
+                 workers=None, prefetch=None, drop_last=False, seed=0):
+        if augment != 'none' and symmetry is None:
+            raise ValueError('augmentation needs the Symmetry of the action layout, e.g. env.symmetry')
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.augment = augment
+        self.symmetry = symmetry
+        self.blocks_per_task = blocks_per_task
+        self.workers = os.cpu_count() if workers is None else workers
+        self.prefetch = prefetch or 2 * max(self.workers, 1)
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        self.pool = None
+
+    def _tasks(self):
+        rng = np.random.RandomState((self.seed, self.epoch))
+        blocks = rng.permutation(self.dataset.n_blocks) if self.shuffle else np.arange(self.dataset.n_blocks)
+        seeds = rng.randint(0, 2 ** 31, size=len(blocks))
+        for i in range(0, len(blocks), self.blocks_per_task):
+            yield blocks[i:i + self.blocks_per_task], int(seeds[i])
+
+    def _chunks(self):
+        if self.workers == 0:
+            for blocks, seed in self._tasks():
+                yield _load_task(blocks, seed, self.shuffle, self.augment, self.symmetry, self.dataset)
+            return
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_loader_init, initargs=(self.dataset.root,))
+        tasks = self._tasks()
+        pending = deque()
+
+        def submit():
+            for blocks, seed in tasks:
+                pending.append(self.pool.apply_async(_load_task, (blocks, seed, self.shuffle,
+                                                                  self.augment, self.symmetry)))
+                return
+
+        try:
+            for _ in range(self.prefetch):
+                submit()
+            while pending:
+                chunk = pending.popleft().get()
+                submit()
+                yield chunk
+        finally:
+            # end of the epoch, or the iteration was abandoned
+            self.close()
+
+    def __iter__(self):
+        carry = None
+        for chunk in self._chunks():
+            if carry is not None:
+                chunk = {field: np.concatenate([carry[field], value]) for field, value in chunk.items()}
+            n = len(chunk['action'])
+            end = n - n % self.batch_size
+            for start in range(0, end, self.batch_size):
+                yield {field: value[start:start + self.batch_size] for field, value in chunk.items()}
+            carry = {field: value[end:] for field, value in chunk.items()} if end < n else None
+        if carry is not None and not self.drop_last:
+            yield carry
+        self.epoch += 1
+
+    def __len__(self):
+        n = len(self.dataset) * (8 if self.augment == 'all' else 1)
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
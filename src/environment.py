@@ -2,9 +2,11 @@ from collections import deque
 from copy import deepcopy as dcopy
 import random
 import numpy as np
-from board.screen import Screen
 from src.player import Player
+from src.rewards import make_reward
 from src.state import State
+from src.symmetry import Symmetry, transform_board
+from src.visits import VisitCounter
 import logging
 logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
@@ -22,13 +24,23 @@ class AgentFighting(object):
         
         self.n_actions = len(self.action_space['Move']) + len(self.action_space['Change']) + 1
         self.num_players = 2
-        self.screen = Screen(render=self._render)
+        self.screen = None
+        if self._render:
+            # pygame is only needed, and imported, when rendering
+            from board.screen import Screen
+            self.screen = Screen(render=True)
         self.players = [Player(i, self.num_players) for i in range(self.num_players)]
         self.current_player = 0
         self.state = None
         self.last_diff_score = 0
-        self.s_counter = {}
+        # visit counts of the observations seen after each step, kept across resets;
+        # opt-in: created by configs['visits'] or by the first visit query
+        self.s_counter = VisitCounter(**configs['visits']) if 'visits' in configs else None
+        # see src/rewards.py
+        self.reward_fn = make_reward(configs.get('reward'))
+        self.recorder = None
         self.reset()
+        self.symmetry = Symmetry(self.state.action_map, self.state.direction_map)
         
     def render(self, state = None):
         if state is None:
@@ -41,20 +53,37 @@ class AgentFighting(object):
         if self._render:
             self.screen.save(path)
     
-    def reset(self):
+    def set_recorder(self, recorder):
+        """
+        Attaches an EpisodeRecorder (see src/recorder.py), the current episode
+        is recorded from its current state and every reset starts a new recording.
+        """
+        self.recorder = recorder
+        if recorder is not None:
+            recorder.start(self.state)
+    
+    def reset(self, state=None):
         """
         Resets the game by resetting player scores, creating a new map, and initializing the game state.
+        :param state: State of a fixed map to play instead of a random one (e.g. src.match.load_match())
         :return: None
         """
         self.players[0].reset_scores()
         self.players[1].reset_scores()
-        self.state = State(self.configs['map'], action_space=self.action_space)
-        self.state.set_players(self.players)
-        self.num_agents = self.state.num_agents
-        self.state.make_random_map()
+        if state is None:
+            self.state = State(self.configs['map'], action_space=self.action_space)
+            self.state.set_players(self.players)
+            self.num_agents = self.state.num_agents
+            self.state.make_random_map()
+        else:
+            self.state = state.clone()
+            self.state.set_players(self.players)
+            self.state.update_score()
         if self._render:
             self.screen.init(self.state)
         self.num_agents = self.state.num_agents
+        if self.recorder is not None:
+            self.recorder.start(self.state)
     
     def in_bounds(self, coords):
         return 0 <= coords[0] < self.state.height and 0 <= coords[1] < self.state.width
@@ -65,12 +94,19 @@ class AgentFighting(object):
     def get_space_size(self):
         return self.get_state()['observation'].shape
             
-    def get_state(self, partial=True, return_object=False):
+    def get_state(self, partial=True, return_object=False, padded=False, features=False, context=False):
         if return_object:
             return dcopy(self.state)
         else:
-            return self.state.get_state(partial=partial)
+            return self.state.get_state(partial=partial, padded=padded, features=features, context=context)
+        
         
+    def get_team_state(self):
+        """
+        Observations and valid actions of all agents of the current player,
+        see State.get_team_state()
+        """
+        return self.state.get_team_state()
         
     def hash_arr(self, arr: np.ndarray):
         s = ''.join([str(x) for x in arr.flatten()])
@@ -83,8 +119,19 @@ class AgentFighting(object):
         s = self.hash_arr(obs)
         return hash(s)
     
+    def visit_counter(self):
+        """
+        The VisitCounter of the environment, step() counts observations once it exists
+        """
+        if self.s_counter is None:
+            self.s_counter = VisitCounter()
+        return self.s_counter
+    
     def is_visited_multiple_times(self, obs):
-        return self.s_counter.get(self.obs_string_representation(obs), 0) > 1
+        return self.visit_counter().count(obs) > 1
+    
+    def get_novelty_bonus(self, obs, scale=1.0):
+        return self.visit_counter().novelty_bonus(obs, scale=scale)
     
     def is_terminal(self):
         """
@@ -179,20 +226,16 @@ class AgentFighting(object):
         return state, action, next_state
     
     def get_symmetric(self, obs, pi):
+        """
+        Returns the 4 rotations of an observation with the matching action vectors
+        """
         obs = np.array(obs)
         pi = np.array(pi)
         sym_obs = []
         sym_pi = []
         for k in range(4):
-            _obs = dcopy(obs)
-            for i in range(obs.shape[0]):
-                obs_layer = self.rotate(obs[i], k=k)
-                _obs[i] = obs_layer
-            pi_layer = dcopy(pi)
-            for i in range(k):
-                pi_layer = pi_layer[[2, 3, 1, 0, 6, 4, 7, 5, 10, 11, 9, 8, 12]]
-            sym_obs.append(_obs)
-            sym_pi.append(pi_layer)
+            sym_obs.append(transform_board(obs, k).copy())
+            sym_pi.append(self.symmetry.transform_actions(pi, k))
             
         return sym_obs, sym_pi
         
@@ -233,6 +276,8 @@ class AgentFighting(object):
         current_agent_idx = self.state.agent_current_idx
         
         self.state.next(action)
+        if self.recorder is not None:
+            self.recorder.record(action, self.state)
         
         if self._render:
             if self.state.agent_current_idx == 0:
@@ -240,26 +285,17 @@ class AgentFighting(object):
             
         new_scores = self.state.scores
         diff_new_score = new_scores[current_player] - new_scores[1 - current_player]
-        reward = 0.25 if diff_new_score > 0 else -0.5
-        
-        if diff_new_score > diff_previous_scores:
-            reward += diff_new_score - diff_previous_scores
-        elif diff_new_score < diff_previous_scores:
-            reward -= diff_previous_scores - diff_new_score
-        else:
-            reward -= 0.1
-            
         next_x, next_y = self.state.agent_coords_in_order[current_player][current_agent_idx]
-        
-        if self.state.territories[current_player][next_x][next_y] == 1:
-            reward -= 0.25
-        else:
-            reward += 0.15
-        
-        if next_x == 0 or next_x == self.state.height - 1 or next_y == 0 or next_y == self.state.width - 1:
-            reward -= 0.2
+        on_territory = self.state.territories[current_player, next_x, next_y] == 1
+        on_border = next_x == 0 or next_x == self.state.height - 1 or next_y == 0 or next_y == self.state.width - 1
+        # Python scalars, reward functions also run on batches of arrays (src/rewards.py);
+        # item() keeps the exact values, scores are floats with non-integer weights
+        reward = self.reward_fn.from_diffs(diff_previous_scores.item(), diff_new_score.item(), bool(on_territory),
+                                           on_border)
             
         self.last_diff_score = diff_new_score
         
         next_state = self.state.get_state()
+        if self.s_counter is not None:
+            self.s_counter.add(next_state['observation'])
         return next_state, reward, self.is_terminal()
\ No newline at end of file
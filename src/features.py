@@ -0,0 +1,90 @@
+"""
+Feature planes of a State, maintained incrementally.
+
+Per player (indexed [player, kind] like State.board):
+    walls_adjacent   number of the player's walls among the 4 neighbours
+    walls_diagonal   number of the player's walls among the 4 diagonal neighbours
+Static, computed once per map:
+    border_adjacent  number of the 4 neighbours outside of the board
+    ponds_adjacent   number of ponds among the 4 neighbours
+    castles_adjacent number of castles among the 4 neighbours
+
+A wall built or destroyed by State.next() only touches the 8 cells around it,
+so the planes are updated in O(1) per step instead of being recomputed. They
+are rebuilt from scratch if the walls changed in any other way.
+
+In observations (State.get_state(features=True)) the planes of the observing
+player come first: walls_adjacent (me, opponent), walls_diagonal (me,
+opponent), border_adjacent, ponds_adjacent, castles_adjacent.
+"""
+import numpy as np
+
+FEATURE_PLANES = ('walls_adjacent', 'walls_adjacent_opponent', 'walls_diagonal', 'walls_diagonal_opponent',
+                  'border_adjacent', 'ponds_adjacent', 'castles_adjacent')
+
+ORTHOGONAL = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DIAGONAL = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def neighbour_counts(mask, offsets):
+    """
+    Number of cells of mask among the neighbours at the given offsets, over the last two axes
+    """
+    mask = np.asarray(mask, dtype=np.int8)
+    height, width = mask.shape[-2:]
+    counts = np.zeros(mask.shape, dtype=np.int8)
+    for dx, dy in offsets:
+        # counts[x, y] += mask[x + dx, y + dy]
+        counts[..., max(0, -dx):height - max(0, dx), max(0, -dy):width - max(0, dy)] += \
+            mask[..., max(0, dx):height + min(0, dx), max(0, dy):width + min(0, dy)]
+    return counts
+
+
+class FeaturePlanes(object):
+    """
+    Use State.feature_planes() to get the planes of a state, kept in sync with its walls.
+    """
+    def __init__(self, state):
+        height, width = state.height, state.width
+        # dynamic planes, [player, walls_adjacent / walls_diagonal]
+        self.walls = np.empty((2, 2, height, width), dtype=np.int8)
+        # static planes: border, ponds, castles adjacency
+        self.static = np.empty((3, height, width), dtype=np.int8)
+        self.static[0] = len(ORTHOGONAL) - neighbour_counts(np.ones((height, width)), ORTHOGONAL)
+        self.static[1] = neighbour_counts(state.ponds, ORTHOGONAL)
+        self.static[2] = neighbour_counts(state.castles, ORTHOGONAL)
+        self.rebuild(state)
+
+    def rebuild(self, state):
+        self.walls[:, 0] = neighbour_counts(state.walls, ORTHOGONAL)
+        self.walls[:, 1] = neighbour_counts(state.walls, DIAGONAL)
+        self.walls_version = state.layer_versions['walls']
+
+    def copy(self):
+        planes = object.__new__(FeaturePlanes)
+        planes.walls = self.walls.copy()
+        planes.static = self.static
+        planes.walls_version = self.walls_version
+        return planes
+
+    def update_wall(self, player, x, y, delta):
+        """
+        A wall of player was built (delta=1) or destroyed (delta=-1) at (x, y)
+        """
+        height, width = self.walls.shape[-2:]
+        for kind, offsets in enumerate((ORTHOGONAL, DIAGONAL)):
+            plane = self.walls[player, kind]
+            for dx, dy in offsets:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < height and 0 <= ny < width:
+                    plane[nx, ny] += delta
+
+    def write(self, out, player, rows=slice(None), cols=slice(None)):
+        """
+        Writes the planes seen by player into out, (7, ...) in FEATURE_PLANES order
+        """
+        walls = self.walls if player == 0 else self.walls[::-1]
+        out[0:2] = walls[:, 0, rows, cols]
+        out[2:4] = walls[:, 1, rows, cols]
+        out[4:] = self.static[:, rows, cols]
+        return out
@@ -0,0 +1,320 @@
+"""
+Hot kernels of State: score flood fill, action legality and the connectivity
+analysis of what-if wall changes.
+
+When Numba is installed the kernels are JIT-compiled with an on-disk cache
+(cache=True, stored in __pycache__ or NUMBA_CACHE_DIR), so only the first
+process ever pays the compilation, call precompile() once before spawning
+workers to make sure the cache is warm. Numba itself is only imported on
+the first kernel call, importing this module is cheap. Without Numba, or with the
+environment variable CASTLE_INVASION_JIT=0, vectorized NumPy versions with
+the same results are used instead.
+"""
+import os
+from importlib.util import find_spec
+from types import SimpleNamespace
+import numpy as np
+
+HAS_NUMBA = find_spec('numba') is not None and os.environ.get('CASTLE_INVASION_JIT', '1') != '0'
+
+
+# --- Numba kernels ----------------------------------------------------------
+
+def _player_scores_loop(own_walls, opp_walls, territory, castles):
+    """
+    Flood fills the cells reachable from the border without crossing the player's
+    own walls, updates the player's territory in place and returns
+    (wall_score, closed_territory_score, open_territory_score, castle_score).
+    """
+    height, width = own_walls.shape
+    avail = np.zeros((height, width), dtype=np.uint8)
+    stack = np.empty((height * width, 2), dtype=np.int64)
+    top = 0
+    for i in range(height):
+        for j in range(width):
+            if (i == 0 or i == height - 1 or j == 0 or j == width - 1) and own_walls[i, j] == 0:
+                avail[i, j] = 1
+                stack[top, 0] = i
+                stack[top, 1] = j
+                top += 1
+    while top > 0:
+        top -= 1
+        x = stack[top, 0]
+        y = stack[top, 1]
+        for k in range(4):
+            nx = x + (1 if k == 2 else -1 if k == 3 else 0)
+            ny = y + (1 if k == 0 else -1 if k == 1 else 0)
+            if 0 <= nx < height and 0 <= ny < width and avail[nx, ny] == 0 and own_walls[nx, ny] == 0:
+                avail[nx, ny] = 1
+                stack[top, 0] = nx
+                stack[top, 1] = ny
+                top += 1
+
+    wall_score = 0
+    avail_score = 0
+    castle_score = 0
+    all_territory_score = 0
+    for i in range(height):
+        for j in range(width):
+            wall_score += own_walls[i, j]
+            avail_score += avail[i, j]
+            if opp_walls[i, j] == 1 and territory[i, j] == 1:
+                territory[i, j] = 0
+            if avail[i, j] == 0 and own_walls[i, j] == 0:
+                territory[i, j] = 1
+                if castles[i, j] == 1:
+                    castle_score += 1
+            all_territory_score += territory[i, j]
+    closed_territory_score = height * width - avail_score - wall_score
+    open_territory_score = all_territory_score - closed_territory_score
+    return wall_score, closed_territory_score, open_territory_score, castle_score
+
+
+def _valid_action_mask_loop(player, x, y, agents, walls, castles, ponds, occupied,
+                            move_offsets, change_offsets, drop_self):
+    """
+    Boolean mask over [moves..., changes..., stay] for the agent of `player` at (x, y).
+    `occupied` marks the cells of agent_coords_in_order of both players.
+    """
+    height, width = castles.shape
+    n_moves = move_offsets.shape[0]
+    n_changes = change_offsets.shape[0]
+    mask = np.zeros(n_moves + n_changes + 1, dtype=np.bool_)
+    for k in range(n_moves):
+        nx = x + move_offsets[k, 0]
+        ny = y + move_offsets[k, 1]
+        if 0 <= nx < height and 0 <= ny < width and occupied[nx, ny] == 0 \
+                and agents[player, nx, ny] == 0 and ponds[nx, ny] == 0 \
+                and walls[0, nx, ny] == 0 and walls[1, nx, ny] == 0 and castles[nx, ny] == 0:
+            mask[k] = True
+    for k in range(n_changes):
+        nx = x + change_offsets[k, 0]
+        ny = y + change_offsets[k, 1]
+        if 0 <= nx < height and 0 <= ny < width and castles[nx, ny] == 0 \
+                and ponds[nx, ny] == 0 and occupied[nx, ny] == 0 \
+                and (drop_self or walls[player, nx, ny] == 0):
+            mask[n_moves + k] = True
+    return mask
+
+
+def _wall_analysis_loop(own_walls, opp_walls, territory, castles):
+    """
+    Connectivity of a player's board for what-if wall changes (see src/whatif.py).
+    Iterative Tarjan DFS from a virtual root linked to the passable border cells,
+    then labelling of the enclosed regions. Returns
+    (reachable, cut_free, cut_castles, labels, region_free, region_castles):
+    cut_* count the non-kept cells / castles cut off from the border when a
+    reachable cell is removed, labels numbers the enclosed regions (-1 elsewhere)
+    and region_* count their non-kept cells / castles. Kept cells are the
+    territory cells without an opponent wall.
+    """
+    height, width = own_walls.shape
+    n = height * width
+    disc = np.zeros((height, width), dtype=np.int64)
+    low = np.zeros((height, width), dtype=np.int64)
+    sub_free = np.zeros((height, width), dtype=np.int64)
+    sub_castles = np.zeros((height, width), dtype=np.int64)
+    cut_free = np.zeros((height, width), dtype=np.int64)
+    cut_castles = np.zeros((height, width), dtype=np.int64)
+    stack_x = np.empty(n, dtype=np.int64)
+    stack_y = np.empty(n, dtype=np.int64)
+    stack_k = np.empty(n, dtype=np.int64)
+    timer = 1
+    for sx in range(height):
+        for sy in range(width):
+            if not (sx == 0 or sx == height - 1 or sy == 0 or sy == width - 1) \
+                    or own_walls[sx, sy] != 0 or disc[sx, sy] != 0:
+                continue
+            disc[sx, sy] = timer
+            low[sx, sy] = timer
+            timer += 1
+            sub_free[sx, sy] = 0 if territory[sx, sy] == 1 and opp_walls[sx, sy] == 0 else 1
+            sub_castles[sx, sy] = castles[sx, sy]
+            stack_x[0] = sx
+            stack_y[0] = sy
+            stack_k[0] = 0
+            top = 1
+            while top > 0:
+                x = stack_x[top - 1]
+                y = stack_y[top - 1]
+                k = stack_k[top - 1]
+                if k < 4:
+                    stack_k[top - 1] = k + 1
+                    nx = x + (1 if k == 2 else -1 if k == 3 else 0)
+                    ny = y + (1 if k == 0 else -1 if k == 1 else 0)
+                    if not (0 <= nx < height and 0 <= ny < width) or own_walls[nx, ny] != 0:
+                        continue
+                    if disc[nx, ny] != 0:
+                        low[x, y] = min(low[x, y], disc[nx, ny])
+                    else:
+                        disc[nx, ny] = timer
+                        low[nx, ny] = timer
+                        timer += 1
+                        sub_free[nx, ny] = 0 if territory[nx, ny] == 1 and opp_walls[nx, ny] == 0 else 1
+                        sub_castles[nx, ny] = castles[nx, ny]
+                        stack_x[top] = nx
+                        stack_y[top] = ny
+                        stack_k[top] = 0
+                        top += 1
+                    continue
+                top -= 1
+                if x == 0 or x == height - 1 or y == 0 or y == width - 1:
+                    # edge to the virtual root
+                    low[x, y] = 0
+                if top > 0:
+                    px = stack_x[top - 1]
+                    py = stack_y[top - 1]
+                    low[px, py] = min(low[px, py], low[x, y])
+                    sub_free[px, py] += sub_free[x, y]
+                    sub_castles[px, py] += sub_castles[x, y]
+                    if low[x, y] >= disc[px, py]:
+                        cut_free[px, py] += sub_free[x, y]
+                        cut_castles[px, py] += sub_castles[x, y]
+
+    labels = np.full((height, width), -1, dtype=np.int64)
+    region_free = np.zeros(n, dtype=np.int64)
+    region_castles = np.zeros(n, dtype=np.int64)
+    n_regions = 0
+    for sx in range(height):
+        for sy in range(width):
+            if disc[sx, sy] != 0 or own_walls[sx, sy] != 0 or labels[sx, sy] >= 0:
+                continue
+            labels[sx, sy] = n_regions
+            stack_x[0] = sx
+            stack_y[0] = sy
+            top = 1
+            while top > 0:
+                top -= 1
+                x = stack_x[top]
+                y = stack_y[top]
+                if not (territory[x, y] == 1 and opp_walls[x, y] == 0):
+                    region_free[n_regions] += 1
+                region_castles[n_regions] += castles[x, y]
+                for k in range(4):
+                    nx = x + (1 if k == 2 else -1 if k == 3 else 0)
+                    ny = y + (1 if k == 0 else -1 if k == 1 else 0)
+                    if 0 <= nx < height and 0 <= ny < width and disc[nx, ny] == 0 \
+                            and own_walls[nx, ny] == 0 and labels[nx, ny] < 0:
+                        labels[nx, ny] = n_regions
+                        stack_x[top] = nx
+                        stack_y[top] = ny
+                        top += 1
+            n_regions += 1
+    return disc > 0, cut_free, cut_castles, labels, region_free[:n_regions], region_castles[:n_regions]
+
+
+# --- NumPy fallbacks ---------------------------------------------------------
+
+def _player_scores_numpy(own_walls, opp_walls, territory, castles):
+    """
+    NumPy version of _player_scores_loop, the flood fill grows by whole-board dilations
+    """
+    height, width = own_walls.shape
+    passable = own_walls == 0
+    avail = np.zeros((height, width), dtype=bool)
+    avail[0, :] = passable[0, :]
+    avail[-1, :] = passable[-1, :]
+    avail[:, 0] |= passable[:, 0]
+    avail[:, -1] |= passable[:, -1]
+    while True:
+        grown = avail.copy()
+        grown[1:, :] |= avail[:-1, :]
+        grown[:-1, :] |= avail[1:, :]
+        grown[:, 1:] |= avail[:, :-1]
+        grown[:, :-1] |= avail[:, 1:]
+        grown &= passable
+        if (grown == avail).all():
+            break
+        avail = grown
+
+    wall_score = int(own_walls.sum())
+    closed_territory_score = height * width - int(avail.sum()) - wall_score
+    enclosed = ~avail & passable
+    territory[(opp_walls == 1) & (territory == 1)] = 0
+    territory[enclosed] = 1
+    castle_score = int((enclosed & (castles == 1)).sum())
+    open_territory_score = int(territory.sum()) - closed_territory_score
+    return wall_score, closed_territory_score, open_territory_score, castle_score
+
+
+def _valid_action_mask_numpy(player, x, y, agents, walls, castles, ponds, occupied,
+                             move_offsets, change_offsets, drop_self):
+    """
+    NumPy version of _valid_action_mask_loop
+    """
+    height, width = castles.shape
+    offsets = np.concatenate([move_offsets, change_offsets])
+    xs = x + offsets[:, 0]
+    ys = y + offsets[:, 1]
+    inside = (xs >= 0) & (xs < height) & (ys >= 0) & (ys < width)
+    xs = np.where(inside, xs, 0)
+    ys = np.where(inside, ys, 0)
+    free = inside & (castles[xs, ys] == 0) & (ponds[xs, ys] == 0) & (occupied[xs, ys] == 0)
+    n_moves = len(move_offsets)
+    moves = free[:n_moves] & (agents[player][xs[:n_moves], ys[:n_moves]] == 0) & \
+        (walls[0][xs[:n_moves], ys[:n_moves]] == 0) & (walls[1][xs[:n_moves], ys[:n_moves]] == 0)
+    changes = free[n_moves:]
+    if not drop_self:
+        changes = changes & (walls[player][xs[n_moves:], ys[n_moves:]] == 0)
+    return np.concatenate([moves, changes, [False]])
+
+
+_backend = None
+
+
+def backend():
+    """
+    Namespace holding the kernel implementations, built on first use
+    """
+    global _backend
+    if _backend is None:
+        if HAS_NUMBA:
+            import numba
+            _backend = SimpleNamespace(
+                player_scores=numba.njit(cache=True)(_player_scores_loop),
+                valid_action_mask=numba.njit(cache=True)(_valid_action_mask_loop),
+                wall_analysis=numba.njit(cache=True)(_wall_analysis_loop),
+            )
+        else:
+            _backend = SimpleNamespace(
+                player_scores=_player_scores_numpy,
+                valid_action_mask=_valid_action_mask_numpy,
+                # no vectorized form of the DFS, the loop runs as plain Python
+                wall_analysis=_wall_analysis_loop,
+            )
+    return _backend
+
+
+def player_scores(own_walls, opp_walls, territory, castles):
+    return backend().player_scores(own_walls, opp_walls, territory, castles)
+
+
+def valid_action_mask(player, x, y, agents, walls, castles, ponds, occupied,
+                      move_offsets, change_offsets, drop_self):
+    return backend().valid_action_mask(player, x, y, agents, walls, castles, ponds, occupied,
+                                       move_offsets, change_offsets, drop_self)
+
+
+def wall_analysis(own_walls, opp_walls, territory, castles):
+    return backend().wall_analysis(own_walls, opp_walls, territory, castles)
+
+
+player_scores.__doc__ = _player_scores_loop.__doc__
+valid_action_mask.__doc__ = _valid_action_mask_loop.__doc__
+wall_analysis.__doc__ = _wall_analysis_loop.__doc__
+
+
+def precompile():
+    """
+    Compiles (or loads from the disk cache) every kernel for the dtypes used by State.
+    No-op without Numba.
+    """
+    if not HAS_NUMBA:
+        return
+    board = np.zeros((3, 3), dtype=np.int8)
+    # State keeps its layers as views of one [player, layer] array
+    layers = np.zeros((2, 3, 3, 3), dtype=np.int8)[:, 0]
+    offsets = np.zeros((1, 2), dtype=np.int64)
+    player_scores(board, board, board.copy(), board)
+    valid_action_mask(0, 1, 1, layers, layers, board, board, board, offsets, offsets, False)
+    wall_analysis(layers[0], layers[1], layers[0], board)
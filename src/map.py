@@ -20,6 +20,34 @@ class Map(object):
         self.n_marks = 0
         self.n_turns = 0
         
+    # layers of self.board, indexed [player, layer]
+    BOARD_LAYERS = ('agents', 'walls', 'territories')
+    
+    def allocate_board(self, height, width):
+        """
+        Allocates the dynamic layers as one (2, 3, height, width) array indexed
+        [player, layer]; agents, walls and territories are (2, height, width) views of it
+        """
+        self.board = np.zeros((2, len(self.BOARD_LAYERS), height, width), dtype=np.int8)
+        self.link_board()
+    
+    def link_board(self):
+        for i, name in enumerate(self.BOARD_LAYERS):
+            setattr(self, name, self.board[:, i])
+    
+    def __getstate__(self):
+        # the layer views are rebuilt from the board, so copies keep sharing one array
+        state = self.__dict__.copy()
+        if 'board' in state:
+            for name in self.BOARD_LAYERS:
+                state.pop(name, None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'board' in state:
+            self.link_board()
+    
     def update_agent_coords_in_order(self):
         self.agent_coords_in_order = [[], []]
         for i in range(self.height):
@@ -32,10 +60,8 @@ class Map(object):
     def make_random_map(self):
         self.height = random.randint(self.height_min, self.height_max)
         self.width = random.randint(self.width_min, self.width_max)
-        self.agents = np.zeros((2, self.height, self.width), dtype=np.int8)
-        self.walls = np.zeros((2, self.height, self.width), dtype=np.int8)
+        self.allocate_board(self.height, self.width)
         self.castles = np.zeros((self.height, self.width), dtype=np.int8)
-        self.territories = np.zeros((2, self.height, self.width), dtype=np.int8)
         self.ponds = np.zeros((self.height, self.width), dtype=np.int8)
         self.n_turns = random.randint(self.min_num_turns, self.max_num_turns)
         self.remaining_turns = self.n_turns
@@ -77,37 +103,45 @@ class Map(object):
     def get_agent_position(self, player_id, agent_id):
         return self.agent_pos[player_id][agent_id]
     
-    def load(self, castles, wall_pos, agent_pos):
-        self.castles = castles
-        self.wall_pos = wall_pos
-        self.agent_pos = agent_pos
-        self.n_agents = len(agent_pos)
-        for x, y in castles:
-            self.castle_board[x, y] = castles[(x, y)]
-        for x, y in wall_pos:
-            self.wall_board[x, y] = 1
-        for x, y in agent_pos[0]:
-            self.conquered_board[0][x, y] = 1
-        for x, y in agent_pos[1]:
-            self.conquered_board[1][x, y] = 1
+    def load(self, castles, ponds, agent_coords, n_turns, walls=None, territories=None):
+        """
+        Sets up a fixed map instead of make_random_map() (see src/match.py)
+        :param castles, ponds: (height, width) 0/1 arrays
+        :param agent_coords: [coords of player 0, coords of player 1], agents in play order
+        :param walls, territories: optional (2, height, width) layers of an ongoing game
+        """
+        self.castles = np.array(castles, dtype=np.int8)
+        self.ponds = np.array(ponds, dtype=np.int8)
+        self.height, self.width = self.castles.shape
+        self.allocate_board(self.height, self.width)
+        if walls is not None:
+            self.walls[:] = walls
+        if territories is not None:
+            self.territories[:] = territories
+        self.agent_coords_in_order = [[tuple(int(v) for v in xy) for xy in coords] for coords in agent_coords]
+        for player, coords in enumerate(self.agent_coords_in_order):
+            for x, y in coords:
+                self.agents[player, x, y] = 1
+        self.num_agents = len(self.agent_coords_in_order[0])
+        self.agent_current_idx = 0
+        self.n_turns = n_turns
+        self.remaining_turns = n_turns
             
     def show_map(self):
-        print('-' * self.width * 4 + '\n')
-        print(self.wall_board)
-        print('\n' + '-' * self.width * 4 + '\n')
-        _board = np.zeros((self.height, self.width), dtype=str)
-        _board.fill(' ')
-        for coord in self.castles:
-            _board[coord[0], coord[1]] = 'T'
-        for coord in self.wall_pos:
-            _board[coord[0], coord[1]] = 'W'
-        for coord in self.agent_pos[0]:
-            _board[coord[0], coord[1]] = 'A'
-        for coord in self.agent_pos[1]:
-            _board[coord[0], coord[1]] = 'B'
-                
-        print(np.array2string(_board, separator=' '))
-        print('\n' + '-' * self.width * 4)
+        """
+        Prints the board: T castle, P pond, A / B agents, a / b walls
+        """
+        _board = np.full((self.height, self.width), '.', dtype=str)
+        _board[self.castles == 1] = 'T'
+        _board[self.ponds == 1] = 'P'
+        _board[self.walls[0] == 1] = 'a'
+        _board[self.walls[1] == 1] = 'b'
+        _board[self.agents[0] == 1] = 'A'
+        _board[self.agents[1] == 1] = 'B'
+        print('-' * self.width * 2)
+        for row in _board:
+            print(' '.join(row))
+        print('-' * self.width * 2)
     
     def in_bounds(self, x, y):
         return x >= 0 and x < self.height and y >= 0 and y < self.width
@@ -0,0 +1,216 @@
+"""
+Official PROCON match maps.
+
+A match file is the JSON of a match as served by the competition API:
+    {"id": 10, "turns": 30, "turnSeconds": 15,
+     "bonus": {"wall": 10, "territory": 30, "castle": 100},
+     "board": {"width": 11, "height": 11, "mason": 6,
+               "structures": [[0, 1, 2, ...], ...],   # 1 pond, 2 castle
+               "masons": [[0, 3, -3, ...], ...]},     # n own mason n, -n opponent mason n
+     "opponent": "...", "first": true}
+A bare board, or the list of matches {"matches": [...]}, is accepted too.
+Boards of ongoing games may also hold "walls" and "territories" (1 own,
+2 opponent, 3 both).
+
+Player 0 is the team that moves first: with "first": false the own masons
+are player 1. The bonus, when present, sets the score weights (alpha, beta,
+gamma) of the State.
+
+The parsed arrays are cached in a flat binary file (an int32 header and the
+int8 layers) named after the SHA-1 of the match file, read back without any
+parsing:
+
+    state = load_match('maps/A1.json', configs['map'])
+    states = load_matches(sorted(glob('maps/*.json')), configs['map'])
+"""
+import os
+import json
+import hashlib
+from argparse import ArgumentParser
+
+import numpy as np
+
+from src.state import State
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'castle-invasion', 'maps')
+# version of the cached arrays, part of the cache key
+CACHE_FORMAT = 2
+
+ACTION_SPACE = {
+    'Move': ['U', 'D', 'L', 'R', 'UL', 'UR', 'DL', 'DR'],
+    'Change': ['U', 'D', 'L', 'R'],
+    'Stay': 1
+}
+
+POND, CASTLE = 1, 2
+
+
+def _owner_layers(board, key, first):
+    """
+    (2, height, width) layers [player 0, player 1] of a field coded 1 own, 2 opponent, 3 both
+    """
+    field = np.asarray(board[key], dtype=np.int8)
+    own, opponent = (field & 1) != 0, (field & 2) != 0
+    return np.stack([own, opponent] if first else [opponent, own]).astype(np.int8)
+
+
+def parse_match(match, index=0):
+    """
+    Arrays of a match JSON object (see the module docstring)
+    :param index: match to read from a list of matches
+    """
+    if 'matches' in match:
+        match = match['matches'][index]
+    board = match['board'] if 'board' in match else match
+    height, width = board['height'], board['width']
+    structures = np.asarray(board['structures'], dtype=np.int8)
+    masons = np.asarray(board['masons'], dtype=np.int8)
+    if structures.shape != (height, width) or masons.shape != (height, width):
+        raise ValueError('board of {}x{} with structures {} and masons {}'.format(
+            height, width, structures.shape, masons.shape))
+    first = match.get('first', True)
+    arrays = {
+        'structures': structures,
+        # masons of player 0 positive, player 1 negative
+        'masons': masons if first else -masons,
+    }
+    if 'turns' in match:
+        arrays['turns'] = np.int32(match['turns'])
+    bonus = match.get('bonus')
+    if bonus is not None:
+        # alpha (wall), beta (castle), gamma (territory)
+        arrays['bonus'] = np.array([bonus['wall'], bonus['castle'], bonus['territory']], dtype=np.int32)
+    for key in ('walls', 'territories'):
+        if key in board:
+            arrays[key] = _owner_layers(board, key, first)
+    return arrays
+
+
+def agent_coords(masons):
+    """
+    Coordinates of the agents of both players, ordered by mason number
+    """
+    coords = []
+    for sign in (1, -1):
+        numbers = masons * sign
+        xs, ys = np.nonzero(numbers > 0)
+        order = np.argsort(numbers[xs, ys], kind='stable')
+        coords.append([(int(xs[i]), int(ys[i])) for i in order])
+    if len(coords[0]) != len(coords[1]):
+        raise ValueError('players have {} and {} masons'.format(len(coords[0]), len(coords[1])))
+    return coords
+
+
+# cache file: int32 header (turns -1 when the match has none), then the int8 layers in this order
+HEADER = ('format', 'height', 'width', 'turns', 'alpha', 'beta', 'gamma', 'has_bonus', 'has_walls', 'has_territories')
+
+
+def pack_arrays(arrays):
+    height, width = arrays['structures'].shape
+    bonus = arrays.get('bonus', np.zeros(3, dtype=np.int32))
+    header = np.array([CACHE_FORMAT, height, width, arrays.get('turns', -1)] + list(bonus) +
+                      ['bonus' in arrays, 'walls' in arrays, 'territories' in arrays], dtype=np.int32)
+    layers = [arrays[key] for key in ('structures', 'masons', 'walls', 'territories') if key in arrays]
+    return header.tobytes() + b''.join(np.ascontiguousarray(layer, dtype=np.int8).tobytes() for layer in layers)
+
+
+def unpack_arrays(data):
+    header = np.frombuffer(data, dtype=np.int32, count=len(HEADER))
+    _, height, width, turns, alpha, beta, gamma, has_bonus, has_walls, has_territories = (int(x) for x in header)
+    cells = np.frombuffer(data, dtype=np.int8, offset=header.nbytes)
+    size = height * width
+    arrays = {
+        'structures': cells[:size].reshape(height, width),
+        'masons': cells[size:2 * size].reshape(height, width),
+    }
+    if turns >= 0:
+        arrays['turns'] = np.int32(turns)
+    if has_bonus:
+        arrays['bonus'] = np.array([alpha, beta, gamma], dtype=np.int32)
+    offset = 2 * size
+    for key, present in (('walls', has_walls), ('territories', has_territories)):
+        if present:
+            arrays[key] = cells[offset:offset + 2 * size].reshape(2, height, width)
+            offset += 2 * size
+    return arrays
+
+
+def read_arrays(path, cache_dir=DEFAULT_CACHE_DIR, index=0):
+    """
+    Parsed arrays of a match file, from the cache when the file was seen before
+    :param cache_dir: directory of the cache, None to always parse the JSON
+    """
+    if cache_dir is None:
+        with open(path) as f:
+            return parse_match(json.load(f), index)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    cache_path = os.path.join(cache_dir, '{}-{}-{}.bin'.format(hashlib.sha1(raw).hexdigest(), index, CACHE_FORMAT))
+    try:
+        with open(cache_path, 'rb') as f:
+            return unpack_arrays(f.read())
+    except FileNotFoundError:
+        pass
+    arrays = parse_match(json.loads(raw), index)
+    os.makedirs(cache_dir, exist_ok=True)
+    # written under a temporary name so concurrent loaders never read a partial file
+    tmp = '{}.{}.tmp'.format(cache_path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(pack_arrays(arrays))
+    os.replace(tmp, cache_path)
+    return arrays
+
+
+def build_state(arrays, configs, action_space=ACTION_SPACE, players=None):
+    """
+    State at the start (or at the saved turn) of a parsed match
+    :param configs: map configs, as configs['map'] of configs/map.json
+    """
+    state = State(configs, action_space=action_space)
+    state.set_players(players)
+    structures = arrays['structures']
+    turns = int(arrays['turns']) if 'turns' in arrays else state.max_num_turns
+    state.load(structures == CASTLE, structures == POND, agent_coords(arrays['masons']), turns,
+               walls=arrays.get('walls'), territories=arrays.get('territories'))
+    if 'bonus' in arrays:
+        state.alpha, state.beta, state.gamma = (int(x) for x in arrays['bonus'])
+    state.update_score()
+    return state
+
+
+def load_match(path, configs, cache_dir=DEFAULT_CACHE_DIR, index=0, players=None):
+    """
+    State of a PROCON match file, see the module docstring
+    """
+    return build_state(read_arrays(path, cache_dir, index), configs, players=players)
+
+
+def load_matches(paths, configs, cache_dir=DEFAULT_CACHE_DIR):
+    return [load_match(path, configs, cache_dir) for path in paths]
+
+
+def argument_parser():
+    parser = ArgumentParser()
+    parser.add_argument('paths', nargs='+', help='Match JSON files')
+    parser.add_argument('--configs', default='configs/map.json')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--show', action='store_true', help='Print the boards')
+    return parser.parse_args()
+
+
+def main():
+    """
+    Fills the cache of a suite of maps, e.g. before an evaluation run
+    """
+    args = argument_parser()
+    configs = json.load(open(args.configs))
+    for path in args.paths:
+        state = load_match(path, configs['map'], args.cache_dir)
+        print('{}: {}x{}, {} agents, {} turns'.format(path, state.height, state.width,
+                                                     state.num_agents, state.n_turns))
+        if args.show:
+            state.show_map()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Append-only metrics store and incremental plotting.
+
+Each series is a directory of fixed-size chunks, one .npy file per column:
+    <root>/<name>/step-000000.npy   int64
+    <root>/<name>/value-000000.npy  float64
+log() only writes into a preallocated buffer; a chunk is written when it is
+full, and the partial chunk is rewritten (atomically) every flush_interval
+seconds so readers see recent values. Chunks never change once full, so a
+reader only loads the chunks it has not seen yet.
+
+The plots are rendered by a separate process (MetricsPlotter.start() or
+`python -m src.metrics <root>`) from a fixed-size min/mean/max summary of
+each series, so the plotting cost does not grow with the length of the run.
+
+    metrics = MetricsWriter('runs/exp1')
+    metrics.log('elo', rating, step=episode)
+    plotter = MetricsPlotter('runs/exp1').start()
+"""
+import os
+import time
+from argparse import ArgumentParser
+import multiprocessing
+
+import numpy as np
+
+COLUMNS = (('step', np.int64), ('value', np.float64))
+
+
+def _chunk_path(root, name, column, index):
+    return os.path.join(root, name, '{}-{:06d}.npy'.format(column, index))
+
+
+def _save_atomic(path, array):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+class _Series(object):
+    def __init__(self, chunk_size, index=0):
+        self.step = np.zeros(chunk_size, dtype=np.int64)
+        self.value = np.zeros(chunk_size, dtype=np.float64)
+        self.fill = 0
+        self.index = index
+        self.count = 0
+        self.dirty = False
+
+
+class MetricsWriter(object):
+    """
+    :param root: directory of the store, a run may append to an existing one
+    :param chunk_size: values per chunk file
+    :param flush_interval: seconds between writes of the partial chunks, None to only write on flush()
+    """
+    def __init__(self, root, chunk_size=4096, flush_interval=5.0):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.series = {}
+        self.last_flush = time.monotonic()
+        os.makedirs(root, exist_ok=True)
+
+    def _open(self, name):
+        if os.sep in name or name.startswith('.'):
+            raise ValueError('invalid series name: {!r}'.format(name))
+        os.makedirs(os.path.join(self.root, name), exist_ok=True)
+        # appends after the last full chunk of an existing series
+        reader = MetricsReader(self.root)
+        index = len(reader.chunks(name))
+        series = _Series(self.chunk_size, index)
+        if index:
+            steps, values = reader.read_chunk(name, index - 1)
+            series.count = (index - 1) * self.chunk_size + len(steps)
+            if len(steps) < self.chunk_size:
+                series.index = index - 1
+                series.fill = len(steps)
+                series.step[:series.fill] = steps
+                series.value[:series.fill] = values
+        self.series[name] = series
+        return series
+
+    def log(self, name, value, step=None):
+        """
+        Appends one value, step defaults to the number of values logged in the series
+        """
+        series = self.series.get(name)
+        if series is None:
+            series = self._open(name)
+        i = series.fill
+        series.step[i] = series.count if step is None else step
+        series.value[i] = value
+        series.fill = i + 1
+        series.count += 1
+        series.dirty = True
+        if series.fill == self.chunk_size:
+            self._write(name, series)
+            series.index += 1
+            series.fill = 0
+        if self.flush_interval is not None and time.monotonic() - self.last_flush > self.flush_interval:
+            self.flush()
+
+    def log_dict(self, values, step=None):
+        for name, value in values.items():
+            self.log(name, value, step)
+
+    def _write(self, name, series):
+        for column, _ in COLUMNS:
+            _save_atomic(_chunk_path(self.root, name, column, series.index),
+                         getattr(series, column)[:series.fill])
+        series.dirty = False
+
+    def flush(self):
+        for name, series in self.series.items():
+            if series.dirty and series.fill:
+                self._write(name, series)
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MetricsReader(object):
+    def __init__(self, root):
+        self.root = root
+
+    def names(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.exists(_chunk_path(self.root, name, 'value', 0)))
+
+    def chunks(self, name):
+        """
+        Indices of the chunks written so far, the last one may be partial
+        """
+        directory = os.path.join(self.root, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(f[6:-4]) for f in os.listdir(directory)
+                      if f.startswith('value-') and f.endswith('.npy'))
+
+    def read_chunk(self, name, index):
+        # the value column is renamed last, never read it before the step column
+        steps = np.load(_chunk_path(self.root, name, 'step', index))
+        values = np.load(_chunk_path(self.root, name, 'value', index))
+        n = min(len(steps), len(values))
+        return steps[:n], values[:n]
+
+    def read(self, name, start_chunk=0):
+        """
+        (steps, values) of a series from chunk start_chunk on
+        """
+        parts = [self.read_chunk(name, index) for index in self.chunks(name) if index >= start_chunk]
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+class Summary(object):
+    """
+    Min / mean / max of a series over at most max_points buckets of equal width
+    (in number of values). When the buckets are full, pairs of buckets are
+    merged and the width doubles, so updates cost O(new values + max_points).
+    """
+    def __init__(self, max_points=1000):
+        self.max_points = max_points - max_points % 2
+        self.width = 1
+        self.step = np.zeros(0, dtype=np.int64)
+        self.low = np.zeros(0)
+        self.high = np.zeros(0)
+        self.total = np.zeros(0)
+        self.count = np.zeros(0, dtype=np.int64)
+
+    def update(self, steps, values):
+        while len(values):
+            if len(self.count) and self.count[-1] < self.width:
+                # fill the last, partial bucket first
+                take = min(self.width - self.count[-1], len(values))
+                head = values[:take]
+                self.low[-1] = min(self.low[-1], head.min())
+                self.high[-1] = max(self.high[-1], head.max())
+                self.total[-1] += head.sum()
+                self.count[-1] += take
+                steps, values = steps[take:], values[take:]
+            elif len(self.count) < self.max_points:
+                n = min(len(values), (self.max_points - len(self.count)) * self.width)
+                self._append(steps[:n], values[:n])
+                steps, values = steps[n:], values[n:]
+            else:
+                self._merge()
+
+    def _append(self, steps, values):
+        width = self.width
+        starts = np.arange(0, len(values), width)
+        self.step = np.concatenate([self.step, steps[starts]])
+        self.low = np.concatenate([self.low, np.minimum.reduceat(values, starts)])
+        self.high = np.concatenate([self.high, np.maximum.reduceat(values, starts)])
+        self.total = np.concatenate([self.total, np.add.reduceat(values, starts)])
+        self.count = np.concatenate([self.count, np.diff(np.append(starts, len(values)))])
+
+    def _merge(self):
+        self.step = self.step[0::2]
+        self.low = np.minimum(self.low[0::2], self.low[1::2])
+        self.high = np.maximum(self.high[0::2], self.high[1::2])
+        self.total = self.total[0::2] + self.total[1::2]
+        self.count = self.count[0::2] + self.count[1::2]
+        self.width *= 2
+
+    @property
+    def mean(self):
+        return self.total / np.maximum(self.count, 1)
+
+
+class MetricsPlotter(object):
+    """
+    Renders <out_dir>/<name>.png for every series of a store, refreshing every
+    `interval` seconds and only reading the chunks written since the last refresh.
+    """
+    def __init__(self, root, out_dir=None, interval=30.0, max_points=1000):
+        self.root = root
+        self.out_dir = out_dir or os.path.join(root, 'plots')
+        self.interval = interval
+        self.max_points = max_points
+        self.reader = MetricsReader(root)
+        self.summaries = {}
+        # per series: chunk index and number of values of that chunk already summarized
+        self.positions = {}
+        self.process = None
+        self.stop_event = None
+
+    def update(self):
+        """
+        Reads the new values of every series, returns the names of the changed ones
+        """
+        changed = []
+        for name in self.reader.names():
+            summary = self.summaries.setdefault(name, Summary(self.max_points))
+            index, seen = self.positions.get(name, (0, 0))
+            for chunk in self.reader.chunks(name):
+                if chunk < index:
+                    continue
+                steps, values = self.reader.read_chunk(name, chunk)
+                if chunk == index:
+                    steps, values = steps[seen:], values[seen:]
+                    seen += len(values)
+                else:
+                    index, seen = chunk, len(values)
+                if len(values):
+                    summary.update(steps, values)
+                    if name not in changed:
+                        changed.append(name)
+            self.positions[name] = (index, seen)
+        return changed
+
+    def render(self, names=None):
+        from src.utils import get_pyplot
+        plt = get_pyplot()
+        os.makedirs(self.out_dir, exist_ok=True)
+        for name in self.summaries if names is None else names:
+            summary = self.summaries[name]
+            fig, ax = plt.subplots()
+            if summary.width > 1:
+                ax.fill_between(summary.step, summary.low, summary.high, alpha=0.3)
+            ax.plot(summary.step, summary.mean)
+            ax.set_xlabel('Step')
+            ax.set_ylabel(name)
+            ax.set_title(name)
+            ax.grid(True)
+            path = os.path.join(self.out_dir, name + '.png')
+            fig.savefig(path + '.tmp.png')
+            os.replace(path + '.tmp.png', path)
+            plt.close(fig)
+
+    def refresh(self):
+        changed = self.update()
+        if changed:
+            self.render(changed)
+        return changed
+
+    def run(self, stop_event=None):
+        while True:
+            self.refresh()
+            if stop_event is None:
+                time.sleep(self.interval)
+            elif stop_event.wait(self.interval):
+                self.refresh()
+                return
+
+    def start(self):
+        """
+        Runs the plotter in a child process until stop()
+        """
+        self.stop_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=_plot_process, daemon=True,
+                                               args=(self.root, self.out_dir, self.interval,
+                                                     self.max_points, self.stop_event))
+        self.process.start()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.stop_event.set()
+            self.process.join()
+            self.process = None
+
+
+def _plot_process(root, out_dir, interval, max_points, stop_event):
+    import matplotlib
+    matplotlib.use('Agg')
+    MetricsPlotter(root, out_dir, interval, max_points).run(stop_event)
+
+
+def argument_parser():
+    parser = ArgumentParser()
+    parser.add_argument('root', help='Directory of a metrics store')
+    parser.add_argument('--out', default=None, help='Output directory of the plots, <root>/plots by default')
+    parser.add_argument('--interval', type=float, default=30.0)
+    parser.add_argument('--max-points', type=int, default=1000)
+    parser.add_argument('--once', action='store_true', help='Render once and exit')
+    return parser.parse_args()
+
+
+def main():
+    args = argument_parser()
+    import matplotlib
+    matplotlib.use('Agg')
+    plotter = MetricsPlotter(args.root, args.out, args.interval, args.max_points)
+    if args.once:
+        plotter.refresh()
+    else:
+        plotter.run()
+
+
+if __name__ == "__main__":
+    main()
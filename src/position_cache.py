@@ -0,0 +1,145 @@
+"""
+Persistent cache of decisions keyed by symmetry-canonical observations.
+
+An observation and its 7 rotated / reflected copies share one entry: the
+key is the digest of the smallest (bytewise) of the 8 transformed boards,
+and action distributions are stored in that canonical orientation and
+permuted back on lookup (see src/symmetry.py).
+
+The table lives in a directory of .npy files opened with mmap, so it can be
+shared read-only between processes and survives restarts:
+    keys.npy    uint64 (n_sets, ways, 2)           128-bit key (top bit set), 0 for empty slots
+    values.npy  float32 (n_sets, ways, n_actions)  distribution, canonical orientation
+    ticks.npy   uint64 (n_sets, ways)              last access, for LRU eviction
+It is set-associative: a key can only live in the `ways` slots of its set,
+and the least recently used slot of the set is evicted when it is full.
+"""
+import hashlib
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from src.symmetry import N_TRANSFORMS, transform_board
+
+
+def canonical_form(obs):
+    """
+    Returns (key, t): the 128-bit key of the canonical orientation of obs and
+    the transform t that maps obs onto it
+    """
+    obs = np.asarray(obs).astype(np.int8)
+    if obs.shape[-1] != obs.shape[-2]:
+        raise ValueError('canonical forms need square observations')
+    best, best_t = None, 0
+    for t in range(N_TRANSFORMS):
+        data = transform_board(obs, t).tobytes()
+        if best is None or data < best:
+            best, best_t = data, t
+    digest = hashlib.blake2b(best, digest_size=16)
+    digest.update(str(obs.shape).encode())
+    # top bit set so that a stored key is never 0
+    key = int.from_bytes(digest.digest(), 'little') | (1 << 127)
+    return key, best_t
+
+
+class PositionCache(object):
+    """
+    :param path: directory of the table, created if missing
+    :param symmetry: a Symmetry of the action layout (e.g. env.symmetry)
+    :param n_sets, ways: capacity is n_sets * ways positions, only used when creating the table
+    :param readonly: open the files read-only, e.g. in workers of a pool
+    """
+    def __init__(self, path, symmetry, n_sets=2 ** 16, ways=8, readonly=False):
+        self.path = path
+        self.symmetry = symmetry
+        self.n_actions = symmetry.permutations.shape[1]
+        mode = 'r' if readonly else 'r+'
+        files = [os.path.join(path, name) for name in ('keys.npy', 'values.npy', 'ticks.npy')]
+        if not all(os.path.exists(f) for f in files):
+            if readonly:
+                raise FileNotFoundError('no position cache in {}'.format(path))
+            os.makedirs(path, exist_ok=True)
+            for f, shape, dtype in zip(files,
+                                       [(n_sets, ways, 2), (n_sets, ways, self.n_actions), (n_sets, ways)],
+                                       [np.uint64, np.float32, np.uint64]):
+                np.lib.format.open_memmap(f, mode='w+', dtype=dtype, shape=shape).flush()
+        self.keys, self.values, self.ticks = [np.load(f, mmap_mode=mode) for f in files]
+        self.n_sets, self.ways = self.ticks.shape
+        if self.values.shape[2] != self.n_actions:
+            raise ValueError('cache in {} stores {} actions, expected {}'.format(
+                path, self.values.shape[2], self.n_actions))
+        self.readonly = readonly
+        self.tick = int(self.ticks.max()) if self.ticks.size else 0
+        self.hits = 0
+        self.misses = 0
+
+    def _locate(self, key):
+        low, high = key & 0xFFFFFFFFFFFFFFFF, key >> 64
+        index = low % self.n_sets
+        keys = self.keys[index]
+        match = np.flatnonzero((keys[:, 0] == low) & (keys[:, 1] == high))
+        return index, (int(match[0]) if len(match) else None), low, high
+
+    def get(self, obs):
+        """
+        Best-known action distribution of obs in its own orientation, None if unknown
+        """
+        key, t = canonical_form(obs)
+        index, way, _, _ = self._locate(key)
+        if way is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if not self.readonly:
+            self.tick += 1
+            self.ticks[index, way] = self.tick
+        return np.array(self.values[index, way])[self.symmetry.permutations[t]]
+
+    def put(self, obs, pi):
+        """
+        Stores (or replaces) the action distribution of obs
+        """
+        key, t = canonical_form(obs)
+        index, way, low, high = self._locate(key)
+        if way is None:
+            empty = np.flatnonzero(self.keys[index, :, 1] == 0)
+            way = int(empty[0]) if len(empty) else int(np.argmin(self.ticks[index]))
+            self.keys[index, way] = (low, high)
+        self.tick += 1
+        self.ticks[index, way] = self.tick
+        self.values[index, way] = self.symmetry.transform_actions(np.asarray(pi, dtype=np.float32), t)
+
+    def __len__(self):
+        return int((self.keys[:, :, 1] != 0).sum())
+
+    def flush(self):
+        if not self.readonly:
+            for array in (self.keys, self.values, self.ticks):
+                array.flush()
+
+
+class CachedPolicy(object):
+    """
+    Agent wrapper answering from a PositionCache and falling back to the wrapped
+    agent on misses, whose decision is then stored as a one-hot distribution.
+    """
+    def __init__(self, agent, cache, store=True):
+        self.agent = agent
+        self.cache = cache
+        self.store = store
+
+    def get_action(self, state, epsilon=0.0):
+        view = state if isinstance(state, Mapping) else state.get_state()
+        obs, valid_actions = view['observation'], view['valid_actions']
+        pi = self.cache.get(obs)
+        if pi is not None:
+            pi = np.where(valid_actions, pi, -np.inf)
+            if np.isfinite(pi).any():
+                return int(np.argmax(pi))
+        action = self.agent.get_action(state)
+        if self.store and not self.cache.readonly:
+            pi = np.zeros(self.cache.n_actions, dtype=np.float32)
+            pi[action] = 1
+            self.cache.put(obs, pi)
+        return action
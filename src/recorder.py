@@ -0,0 +1,247 @@
+"""
+Episode recording and replay.
+
+The recorder keeps the initial map, then for every step the action, the
+turn counters, the scores and the cells of the dynamic layers (agents,
+walls, territories) that changed. A full snapshot of the dynamic layers is
+kept every `snapshot_interval` steps so the replayer can seek to any step
+by applying at most `snapshot_interval` diffs.
+
+    recorder = EpisodeRecorder(seed=0)
+    env.set_recorder(recorder)
+    ... play ...
+    recorder.save('game.npz')
+
+    replayer = EpisodeReplayer.load('game.npz')
+    replayer.play(screen)              # or replayer.frame(42).to_text()
+"""
+import json
+import time
+import numpy as np
+
+# order of the dynamic layers in a packed board
+LAYERS = ('agents', 'walls', 'territories')
+
+
+def pack_board(state):
+    """
+    Dynamic layers of a state as one (6, height, width) int8 array:
+    agents A/B, walls A/B, territories A/B
+    """
+    return np.concatenate([state.agents, state.walls, state.territories])
+
+
+def diff_board(previous, current):
+    """
+    Flat indices and new values of the cells that differ between two packed boards
+    """
+    index = np.flatnonzero(previous != current).astype(np.int32)
+    return index, current.reshape(-1)[index]
+
+
+class Frame(object):
+    """
+    Board of a recorded game at a given step, exposes the attributes used by
+    Screen.init / Screen.load_state so it can be rendered like a State.
+    """
+    def __init__(self, step, board, castles, ponds, scores, current_player,
+                 agent_current_idx, remaining_turns, action=None):
+        self.step = step
+        self.board = board
+        self.height, self.width = castles.shape
+        self.agents = board[0:2]
+        self.walls = board[2:4]
+        self.territories = board[4:6]
+        self.castles = castles
+        self.ponds = ponds
+        self.scores = scores
+        self.current_player = current_player
+        self.agent_current_idx = agent_current_idx
+        self.remaining_turns = remaining_turns
+        self.action = action
+
+    def to_text(self):
+        """
+        Headless rendering: one character per cell, same priorities as Screen.load_state
+        """
+        layers = [
+            (self.walls[0], 'x'), (self.walls[1], 'o'), (self.castles, 'C'),
+            (self.ponds, '~'), (self.agents[0], 'A'), (self.agents[1], 'B'),
+            (self.territories[0], '+'), (self.territories[1], '-'),
+        ]
+        board = np.full((self.height, self.width), '.', dtype='<U1')
+        for layer, char in reversed(layers):
+            board[layer == 1] = char
+        lines = [' '.join(row) for row in board]
+        lines.append('Step: {}  Scores: {} - {}  Steps left: {}'.format(
+            self.step, self.scores[0], self.scores[1], self.remaining_turns))
+        return '\n'.join(lines)
+
+
+class EpisodeRecorder(object):
+    """
+    Records one episode of an AgentFighting env, see AgentFighting.set_recorder().
+    start() is called by the env on reset, record() after every step.
+    """
+    def __init__(self, snapshot_interval=32, seed=None):
+        self.snapshot_interval = snapshot_interval
+        self.seed = seed
+        self.meta = None
+
+    def start(self, state):
+        self.meta = {
+            'seed': self.seed,
+            'height': state.height,
+            'width': state.width,
+            'num_agents': state.num_agents,
+            'n_turns': state.n_turns,
+            'alpha': state.alpha,
+            'beta': state.beta,
+            'gamma': state.gamma,
+            'created': time.time(),
+        }
+        self.castles = state.castles.copy()
+        self.ponds = state.ponds.copy()
+        self._board = pack_board(state)
+        self.initial = self._board.copy()
+        self.initial_scalars = (state.current_player, state.agent_current_idx, state.remaining_turns)
+        self.initial_scores = np.array(state.scores, dtype=np.float64)
+        self.actions = []
+        self.scalars = []
+        self.scores = []
+        self.diff_index = []
+        self.diff_value = []
+        self.snapshot_steps = [0]
+        self.snapshots = [self.initial]
+
+    def record(self, action, state):
+        board = pack_board(state)
+        index, value = diff_board(self._board, board)
+        self._board = board
+        self.actions.append(action)
+        self.scalars.append((state.current_player, state.agent_current_idx, state.remaining_turns))
+        self.scores.append(state.scores)
+        self.diff_index.append(index)
+        self.diff_value.append(value)
+        if len(self.actions) % self.snapshot_interval == 0:
+            self.snapshot_steps.append(len(self.actions))
+            self.snapshots.append(board)
+
+    def __len__(self):
+        return 0 if self.meta is None else len(self.actions)
+
+    def to_arrays(self):
+        """
+        The episode as a dict of arrays, the format used by save() and EpisodeReplayer
+        """
+        n = len(self.actions)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(index) for index in self.diff_index])
+        return {
+            'meta': np.array(json.dumps(self.meta)),
+            'castles': self.castles,
+            'ponds': self.ponds,
+            'initial_scalars': np.array(self.initial_scalars, dtype=np.int32),
+            'initial_scores': self.initial_scores,
+            'actions': np.array(self.actions, dtype=np.int16),
+            'scalars': np.array(self.scalars, dtype=np.int32).reshape(n, 3),
+            'scores': np.array(self.scores, dtype=np.float64).reshape(n, 2),
+            'diff_offsets': offsets,
+            'diff_index': np.concatenate(self.diff_index or [np.zeros(0, np.int32)]),
+            'diff_value': np.concatenate(self.diff_value or [np.zeros(0, np.int8)]),
+            'snapshot_steps': np.array(self.snapshot_steps, dtype=np.int64),
+            'snapshots': np.stack(self.snapshots),
+        }
+
+    def save(self, path):
+        np.savez_compressed(path, **self.to_arrays())
+
+    def replayer(self):
+        return EpisodeReplayer(self.to_arrays())
+
+
+class EpisodeReplayer(object):
+    """
+    Random access to the frames of a recorded episode. Frame 0 is the initial
+    board, frame n the board after the n-th step.
+    """
+    def __init__(self, arrays):
+        self.meta = json.loads(str(arrays['meta']))
+        self.castles = arrays['castles']
+        self.ponds = arrays['ponds']
+        self.initial_scalars = tuple(int(x) for x in arrays['initial_scalars'])
+        self.initial_scores = arrays['initial_scores']
+        self.actions = arrays['actions']
+        self.scalars = arrays['scalars']
+        self.scores = arrays['scores']
+        self.diff_offsets = arrays['diff_offsets']
+        self.diff_index = arrays['diff_index']
+        self.diff_value = arrays['diff_value']
+        self.snapshot_steps = arrays['snapshot_steps']
+        self.snapshots = arrays['snapshots']
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def __len__(self):
+        return len(self.actions) + 1
+
+    def _apply(self, board, step):
+        start, end = self.diff_offsets[step - 1], self.diff_offsets[step]
+        board.reshape(-1)[self.diff_index[start:end]] = self.diff_value[start:end]
+
+    def _frame(self, step, board):
+        if step == 0:
+            player, agent_idx, remaining_turns = self.initial_scalars
+            return Frame(0, board, self.castles, self.ponds, self.initial_scores,
+                         player, agent_idx, remaining_turns)
+        player, agent_idx, remaining_turns = (int(x) for x in self.scalars[step - 1])
+        return Frame(step, board, self.castles, self.ponds, self.scores[step - 1],
+                     player, agent_idx, remaining_turns, action=int(self.actions[step - 1]))
+
+    def frame(self, step):
+        """
+        Board after `step` steps, rebuilt from the closest snapshot
+        """
+        if not 0 <= step < len(self):
+            raise IndexError('step {} out of range [0, {})'.format(step, len(self)))
+        k = np.searchsorted(self.snapshot_steps, step, side='right') - 1
+        board = self.snapshots[k].copy()
+        for s in range(int(self.snapshot_steps[k]) + 1, step + 1):
+            self._apply(board, s)
+        return self._frame(step, board)
+
+    def frames(self, start=0, stop=None):
+        """
+        Iterates over consecutive frames, each frame owns its board
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        frame = self.frame(start)
+        yield frame
+        board = frame.board
+        for step in range(start + 1, stop):
+            board = board.copy()
+            self._apply(board, step)
+            yield self._frame(step, board)
+
+    def play(self, screen, start=0, stop=None, delay=0.05, save_pattern=None):
+        """
+        Feeds the frames to a Screen, optionally saving every frame to
+        save_pattern.format(step=...)
+        """
+        first = True
+        for frame in self.frames(start, stop):
+            if first:
+                screen.init(frame)
+                first = False
+            else:
+                screen.load_state(frame)
+                screen.render()
+            if save_pattern is not None:
+                screen.save(save_pattern.format(step=frame.step))
+            if delay:
+                time.sleep(delay)
@@ -0,0 +1,249 @@
+"""
+Streaming self-play data generation.
+
+Games are played by a pool of worker processes, each game comes back as a
+batch of samples (observation, valid_actions, action, reward, outcome) with
+symmetry augmentation already applied in the worker. The parent consumes
+the games as a generator and only keeps `max_pending` games in flight, so a
+slow consumer (e.g. the shard writer) throttles the workers instead of
+filling memory.
+
+Usage: python -m src.selfplay --games 10000 --out data/selfplay --augment random
+       python -m src.selfplay --games 100000 --out data/corpus --format indexed --augment none
+"""
+import json
+import os
+from argparse import ArgumentParser
+from collections import deque
+from importlib import import_module
+import multiprocessing
+
+import numpy as np
+
+from src import kernels
+from src.environment import AgentFighting
+from src.symmetry import N_TRANSFORMS, transform_board
+from src.utils import seeded
+
+SAMPLE_FIELDS = ('observation', 'valid_actions', 'action', 'reward', 'outcome',
+                 'game', 'turn', 'agent', 'player')
+
+
+def load_agent(spec):
+    """
+    Resolves 'algorithms.StupidMove:StupidMove' style agent specs
+    """
+    module, name = spec.split(':')
+    return getattr(import_module(module), name)
+
+
+def play_game(game_id, configs, agents, augment='none', partial=True):
+    """
+    Plays one game and returns its samples as a dict of arrays (see SAMPLE_FIELDS).
+    :param agents: the agent classes (or factories taking n_actions and num_agents) of both players
+    :param augment: 'none', 'random' (one random symmetry per sample) or 'all' (8 per sample)
+    """
+    # seeded per game, without touching the random state of the caller (workers=0)
+    with seeded(game_id):
+        return _play_game(game_id, configs, agents, augment, partial)
+
+
+def _play_game(game_id, configs, agents, augment, partial):
+    env = AgentFighting(None, configs, render=False)
+    players = [agent(n_actions=env.n_actions, num_agents=env.num_agents) for agent in agents]
+    records = {field: [] for field in SAMPLE_FIELDS if field != 'outcome'}
+    state = env.get_state(partial=partial)
+    while not env.is_terminal():
+        player = state['player-id']
+        action = players[player].get_action(state)
+        records['observation'].append(state['observation'])
+        records['valid_actions'].append(state['valid_actions'])
+        records['action'].append(action)
+        records['turn'].append(env.state.n_turns - state['remaning_turns'])
+        records['agent'].append(state['current-agent-id'])
+        records['player'].append(player)
+        state, reward, _ = env.step(action)
+        records['reward'].append(reward)
+
+    winner = env.get_winner()
+    samples = {
+        'observation': np.array(records['observation'], dtype=np.int8),
+        'valid_actions': np.array(records['valid_actions'], dtype=bool),
+        'action': np.array(records['action'], dtype=np.int16),
+        'reward': np.array(records['reward'], dtype=np.float32),
+        'turn': np.array(records['turn'], dtype=np.int16),
+        'agent': np.array(records['agent'], dtype=np.int8),
+        'player': np.array(records['player'], dtype=np.int8),
+    }
+    samples['outcome'] = np.where(winner == -1, 0, np.where(samples['player'] == winner, 1, -1)).astype(np.int8)
+    samples['game'] = np.full(len(samples['action']), game_id, dtype=np.int64)
+    return augment_samples(samples, env.symmetry, augment)
+
+
+def augment_samples(samples, symmetry, augment='random', rng=np.random):
+    """
+    Applies board symmetries to a batch of samples, 'random' keeps the batch size,
+    'all' returns 8 transformed copies of every sample.
+    """
+    if augment == 'none' or len(samples['action']) == 0:
+        return samples
+    if samples['observation'].shape[-1] != samples['observation'].shape[-2]:
+        raise ValueError('symmetry augmentation needs square observations')
+    if augment == 'all':
+        transforms = np.repeat(np.arange(N_TRANSFORMS)[None], len(samples['action']), axis=0).reshape(-1)
+        samples = {field: np.repeat(value, N_TRANSFORMS, axis=0) for field, value in samples.items()}
+    elif augment == 'random':
+        transforms = rng.randint(0, N_TRANSFORMS, size=len(samples['action']))
+        samples = dict(samples)
+    else:
+        raise ValueError('unknown augmentation: {}'.format(augment))
+    observation = samples['observation'].copy()
+    valid_actions = samples['valid_actions'].copy()
+    action = samples['action'].copy()
+    for t in range(N_TRANSFORMS):
+        rows = np.flatnonzero(transforms == t)
+        if len(rows) == 0 or t == 0:
+            continue
+        observation[rows] = transform_board(samples['observation'][rows], t)
+        valid_actions[rows] = symmetry.transform_actions(samples['valid_actions'][rows], t)
+        action[rows] = symmetry.permutations[t][samples['action'][rows]]
+    samples['observation'] = observation
+    samples['valid_actions'] = valid_actions
+    samples['action'] = action
+    return samples
+
+
+def _worker_init():
+    kernels.precompile()
+
+
+def generate(game_ids, configs, agents, augment='none', partial=True, workers=None, max_pending=None):
+    """
+    Yields the samples of each game (dict of arrays) as the games complete, in order.
+    At most max_pending games (default 2 per worker) are running or waiting to be consumed.
+    workers=0 plays the games in the current process.
+    """
+    if workers == 0:
+        for game_id in game_ids:
+            yield play_game(game_id, configs, agents, augment, partial)
+        return
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+    game_ids = iter(game_ids)
+    with multiprocessing.Pool(workers, initializer=_worker_init) as pool:
+        pending = deque()
+
+        def submit():
+            for game_id in game_ids:
+                pending.append(pool.apply_async(play_game, (game_id, configs, agents, augment, partial)))
+                return
+
+        for _ in range(max_pending):
+            submit()
+        while pending:
+            samples = pending.popleft().get()
+            submit()
+            yield samples
+
+
+def iter_samples(games):
+    """
+    Flattens the game batches of generate() into one dict per sample
+    """
+    for samples in games:
+        for i in range(len(samples['action'])):
+            yield {field: value[i] for field, value in samples.items()}
+
+
+class ShardWriter(object):
+    """
+    Writes sample batches into compressed .npz shards of exactly shard_size
+    samples (the last one may be smaller). Rows are copied into a preallocated
+    buffer, so memory stays bounded by one shard.
+    """
+    def __init__(self, out_dir, shard_size=8192, prefix='shard'):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.n_shards = 0
+        self.n_samples = 0
+        self.buffer = None
+        self.fill = 0
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _allocate(self, samples):
+        self.buffer = {field: np.zeros((self.shard_size,) + value.shape[1:], dtype=value.dtype)
+                       for field, value in samples.items()}
+
+    def write(self, samples):
+        if self.buffer is None:
+            self._allocate(samples)
+        n = len(samples['action'])
+        start = 0
+        while start < n:
+            count = min(n - start, self.shard_size - self.fill)
+            for field, value in samples.items():
+                self.buffer[field][self.fill:self.fill + count] = value[start:start + count]
+            self.fill += count
+            start += count
+            if self.fill == self.shard_size:
+                self.flush()
+
+    def flush(self):
+        if self.fill == 0:
+            return
+        path = os.path.join(self.out_dir, '{}-{:05d}.npz'.format(self.prefix, self.n_shards))
+        np.savez_compressed(path, **{field: value[:self.fill] for field, value in self.buffer.items()})
+        self.n_shards += 1
+        self.n_samples += self.fill
+        self.fill = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def argument_parser():
+    parser = ArgumentParser()
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--first-game', type=int, default=0, help='Id (and seed) of the first game')
+    parser.add_argument('--out', default='data/selfplay')
+    parser.add_argument('--shard-size', type=int, default=8192)
+    parser.add_argument('--augment', choices=['none', 'random', 'all'], default='random')
+    parser.add_argument('--format', choices=['npz', 'indexed'], default='npz',
+                        help='npz shards, or an indexed dataset (src/dataset.py), best written with --augment none')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--configs', default='configs/map.json')
+    parser.add_argument('--agents', nargs=2, default=['algorithms.StupidMove:StupidMove'] * 2,
+                        help='module:Class of the agents of both players')
+    args = parser.parse_args()
+    if args.format == 'indexed':
+        from src.dataset import DEFAULT_BLOCK_SIZE
+        if args.shard_size % DEFAULT_BLOCK_SIZE:
+            parser.error('--shard-size must be a multiple of {} with --format indexed'.format(DEFAULT_BLOCK_SIZE))
+    return args
+
+
+def main():
+    args = argument_parser()
+    configs = json.load(open(args.configs))
+    agents = [load_agent(spec) for spec in args.agents]
+    game_ids = range(args.first_game, args.first_game + args.games)
+    if args.format == 'indexed':
+        from src.dataset import DatasetWriter
+        writer = DatasetWriter(args.out, shard_size=args.shard_size)
+    else:
+        writer = ShardWriter(args.out, shard_size=args.shard_size)
+    with writer:
+        for samples in generate(game_ids, configs, agents, augment=args.augment, workers=args.workers):
+            writer.write(samples)
+    print('Wrote {} samples to {}'.format(writer.n_samples, args.out))
+
+
+if __name__ == "__main__":
+    main()
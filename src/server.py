@@ -0,0 +1,270 @@
+"""
+Local stand-in for the PROCON match server: hosts many concurrent
+AgentFighting games over TCP in one asyncio event loop.
+
+Protocol: one JSON object per line.
+
+    client -> {"type": "join", "name": "my-bot"}
+    server -> {"type": "start", "match": 3, "player": 0, "height": 15, "width": 15,
+               "num_agents": 3, "n_turns": 20, "turn_timeout": 3.0,
+               "castles": [[x, y], ...], "ponds": [[x, y], ...],
+               "changes": [[layer, x, y, value], ...]}
+    server -> {"type": "turn", "seq": 7, "player": 0, "remaining_turns": 12,
+               "scores": [a, b], "changes": [...], "rejected": [...], "timeout": false}
+    client -> {"type": "actions", "seq": 7, "actions": [a_0, ..., a_{n-1}]}
+    server -> {"type": "update", ...}   (to the waiting player, same fields as "turn")
+    server -> {"type": "end", "scores": [a, b], "winner": 0}
+    server -> {"type": "error", "message": "..."}   (reply to a message that is not a JSON object)
+
+`changes` only lists the cells that changed since the last message sent to
+that client, layer being 0/1 agents A/B, 2/3 walls A/B, 4/5 territories A/B
+(see src/recorder.py), coordinates are in the full board. The first message
+of a match carries every set cell. Actions are validated with
+State.is_valid_action before being applied, rejected ones and late answers
+are played as 'Stay'.
+
+Usage: python -m src.server --port 8765 --turn-timeout 3 [--bots 200]
+"""
+import asyncio
+import json
+import logging
+import random
+from argparse import ArgumentParser
+
+import numpy as np
+
+from src.environment import AgentFighting
+from src.recorder import pack_board, diff_board
+
+log = logging.getLogger(__name__)
+
+STAY = 12
+
+
+class Client(object):
+    def __init__(self, reader, writer, name):
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.board = None
+
+    async def send(self, message):
+        self.writer.write((json.dumps(message) + '\n').encode())
+        await self.writer.drain()
+
+    async def receive(self, timeout=None):
+        line = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not line:
+            raise ConnectionError('client {} disconnected'.format(self.name))
+        return json.loads(line)
+
+    def changes(self, board):
+        """
+        Cells of the packed board that changed since the last call, as [layer, x, y, value]
+        """
+        previous = np.zeros_like(board) if self.board is None else self.board
+        index, value = diff_board(previous, board)
+        self.board = board
+        layer, cell = np.divmod(index, board.shape[1] * board.shape[2])
+        x, y = np.divmod(cell, board.shape[2])
+        return np.stack([layer, x, y, value]).T.tolist()
+
+    def connected(self):
+        return not (self.writer.is_closing() or self.reader.at_eof())
+
+    def close(self):
+        self.writer.close()
+
+
+class Match(object):
+    def __init__(self, match_id, clients, configs, turn_timeout):
+        self.match_id = match_id
+        self.clients = clients
+        self.turn_timeout = turn_timeout
+        self.env = AgentFighting(None, configs, render=False)
+        self.seq = 0
+
+    def _cells(self, layer):
+        return np.argwhere(layer == 1).tolist()
+
+    async def _start(self):
+        state = self.env.state
+        board = pack_board(state)
+        for player, client in enumerate(self.clients):
+            await client.send({
+                'type': 'start',
+                'match': self.match_id,
+                'player': player,
+                'height': state.height,
+                'width': state.width,
+                'num_agents': state.num_agents,
+                'n_turns': state.n_turns,
+                'turn_timeout': self.turn_timeout,
+                'castles': self._cells(state.castles),
+                'ponds': self._cells(state.ponds),
+                'changes': client.changes(board),
+            })
+
+    async def _broadcast(self, mover, rejected, timeout):
+        state = self.env.state
+        board = pack_board(state)
+        for player, client in enumerate(self.clients):
+            await client.send({
+                'type': 'turn' if player == mover else 'update',
+                'seq': self.seq,
+                'player': mover,
+                'remaining_turns': state.remaining_turns,
+                'scores': state.scores.tolist(),
+                'changes': client.changes(board),
+                'rejected': rejected,
+                'timeout': timeout,
+            })
+
+    async def _read_actions(self, client):
+        """
+        Waits for the answer to the current turn, older answers are dropped
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.turn_timeout
+        while True:
+            message = await client.receive(timeout=max(0.0, deadline - loop.time()))
+            if not isinstance(message, dict):
+                await client.send({'type': 'error', 'message': 'expected a JSON object'})
+                continue
+            if message.get('type') == 'actions' and message.get('seq') == self.seq:
+                return message.get('actions', [])
+
+    def _play(self, actions):
+        state = self.env.state
+        rejected = []
+        for idx in range(state.num_agents):
+            action = actions[idx] if idx < len(actions) else STAY
+            if not isinstance(action, int) or not state.is_valid_action(action, drop_self=True):
+                if action != STAY:
+                    rejected.append(idx)
+                action = STAY
+            self.env.step(action)
+        return rejected
+
+    async def run(self):
+        rejected, timeout = [], False
+        await self._start()
+        while not self.env.is_terminal():
+            mover = self.env.state.current_player
+            self.seq += 1
+            await self._broadcast(mover, rejected, timeout)
+            try:
+                actions = await self._read_actions(self.clients[mover])
+                timeout = False
+            except asyncio.TimeoutError:
+                actions, timeout = [], True
+            rejected = self._play(actions)
+        scores = self.env.state.scores.tolist()
+        for client in self.clients:
+            await client.send({'type': 'end', 'scores': scores, 'winner': self.env.get_winner()})
+        return scores
+
+
+class MatchServer(object):
+    """
+    Pairs the clients in join order and runs every match as a task of the event loop
+    """
+    def __init__(self, configs, turn_timeout=3.0):
+        self.configs = configs
+        self.turn_timeout = turn_timeout
+        self.waiting = None
+        self.matches = set()
+        self.n_matches = 0
+        self.results = []
+
+    async def handle_client(self, reader, writer):
+        client = Client(reader, writer, name=None)
+        try:
+            message = await client.receive(timeout=self.turn_timeout)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            writer.close()
+            return
+        if not isinstance(message, dict):
+            await client.send({'type': 'error', 'message': 'expected a JSON object'})
+            writer.close()
+            return
+        client.name = message.get('name', 'anonymous')
+        if self.waiting is not None and not self.waiting.connected():
+            # the waiting client left before being paired
+            self.waiting.close()
+            self.waiting = None
+        if self.waiting is None:
+            self.waiting = client
+            return
+        clients, self.waiting = [self.waiting, client], None
+        random.shuffle(clients)
+        self.n_matches += 1
+        task = asyncio.ensure_future(self._run_match(self.n_matches, clients))
+        self.matches.add(task)
+        task.add_done_callback(self.matches.discard)
+
+    async def _run_match(self, match_id, clients):
+        match = Match(match_id, clients, self.configs, self.turn_timeout)
+        try:
+            scores = await match.run()
+            self.results.append((match_id, clients[0].name, clients[1].name, scores))
+            log.info('Match {}: {} vs {} -> {}'.format(match_id, clients[0].name, clients[1].name, scores))
+        except (ConnectionError, ValueError) as e:
+            log.warning('Match {} aborted: {}'.format(match_id, e))
+        finally:
+            for client in clients:
+                client.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        log.info('Match server listening on {}:{}'.format(host, port))
+        return server
+
+
+async def random_bot(name, host='127.0.0.1', port=8765):
+    """
+    Minimal client playing random actions, used to load-test the server
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    client = Client(reader, writer, name)
+    await client.send({'type': 'join', 'name': name})
+    num_agents = 0
+    while True:
+        message = await client.receive()
+        if message['type'] == 'start':
+            num_agents = message['num_agents']
+        elif message['type'] == 'turn':
+            actions = [random.randrange(STAY) for _ in range(num_agents)]
+            await client.send({'type': 'actions', 'seq': message['seq'], 'actions': actions})
+        elif message['type'] == 'end':
+            client.close()
+            return message
+
+
+def argument_parser():
+    parser = ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--turn-timeout', type=float, default=3.0,
+                        help='Seconds a player has to send the actions of a turn')
+    parser.add_argument('--configs', default='configs/map.json')
+    parser.add_argument('--bots', type=int, default=0,
+                        help='Number of local random bots to connect, then exit when their games end')
+    return parser.parse_args()
+
+
+async def main():
+    args = argument_parser()
+    configs = json.load(open(args.configs))
+    server = MatchServer(configs, turn_timeout=args.turn_timeout)
+    tcp_server = await server.serve(args.host, args.port)
+    async with tcp_server:
+        if args.bots:
+            await asyncio.gather(*[random_bot('bot-{}'.format(i), args.host, args.port)
+                                   for i in range(args.bots)])
+        else:
+            await tcp_server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+"""
+Spatial analytics on top of State: multi-source BFS distance fields over
+the 8-direction moves of State.direction_map.
+
+A cell is passable when it holds no pond, no castle and no wall of either
+player. Agents are not treated as obstacles since they move every turn.
+Distances are in moves, unreachable cells are -1. Source cells are at
+distance 0 even when they are not passable themselves (a castle, a wall),
+so a value of 1 means "adjacent to a source".
+"""
+import numpy as np
+
+UNREACHABLE = -1
+
+
+def dilate(mask):
+    """
+    8-neighbourhood dilation of a boolean mask over its last two axes
+    """
+    out = mask.copy()
+    out[..., 1:, :] |= mask[..., :-1, :]
+    out[..., :-1, :] |= mask[..., 1:, :]
+    rows = out.copy()
+    out[..., :, 1:] |= rows[..., :, :-1]
+    out[..., :, :-1] |= rows[..., :, 1:]
+    return out
+
+
+def bfs_distances(sources, passable):
+    """
+    Multi-source BFS distances for a batch of source masks.
+    :param sources: boolean array (..., height, width), one source set per leading index
+    :param passable: boolean array (height, width)
+    :return: int16 array shaped like sources, UNREACHABLE where no path exists
+    """
+    sources = np.asarray(sources, dtype=bool)
+    dist = np.full(sources.shape, UNREACHABLE, dtype=np.int16)
+    dist[sources] = 0
+    seen = sources.copy()
+    frontier = sources
+    d = 0
+    while frontier.any():
+        d += 1
+        frontier = dilate(frontier) & passable & ~seen
+        dist[frontier] = d
+        seen |= frontier
+    return dist
+
+
+class DistanceFields(object):
+    """
+    Distance fields of a State, cached per version of the layers they
+    depend on. Fields only depending on the obstacles survive agent moves
+    and are recomputed only when a wall is built or destroyed.
+    Use State.distance_fields() to get the instance bound to a state.
+    """
+    def __init__(self, state):
+        self.state = state
+        self._cache = {}
+
+    def _cached(self, key, layers, compute):
+        versions = tuple(self.state.layer_versions[layer] for layer in layers)
+        entry = self._cache.get(key)
+        if entry is None or entry[0] != versions:
+            entry = self._cache[key] = (versions, compute())
+        return entry[1]
+
+    def passable(self):
+        """
+        Boolean mask of the cells an agent can move onto
+        """
+        def compute():
+            state = self.state
+            return (state.ponds == 0) & (state.castles == 0) & \
+                (state.walls[0] == 0) & (state.walls[1] == 0)
+        return self._cached('passable', ('walls',), compute)
+
+    def from_cells(self, cells):
+        """
+        Uncached distance field from an arbitrary set of (x, y) cells
+        """
+        sources = np.zeros((self.state.height, self.state.width), dtype=bool)
+        for x, y in cells:
+            sources[x, y] = True
+        return bfs_distances(sources, self.passable())
+
+    def to_castles(self):
+        """
+        Distance from every cell to the nearest castle
+        """
+        return self._cached('castles', ('walls',),
+                            lambda: bfs_distances(self.state.castles == 1, self.passable()))
+
+    def to_walls(self, player):
+        """
+        Distance from every cell to the nearest wall of the given player
+        """
+        return self._cached(('walls', player), ('walls',),
+                            lambda: bfs_distances(self.state.walls[player] == 1, self.passable()))
+
+    def frontier(self, player):
+        """
+        Cells outside the player's territory and walls that touch its territory
+        horizontally or vertically, where the territory can grow or be attacked.
+        """
+        def compute():
+            territory = self.state.territories[player] == 1
+            touching = np.zeros_like(territory)
+            touching[1:, :] |= territory[:-1, :]
+            touching[:-1, :] |= territory[1:, :]
+            touching[:, 1:] |= territory[:, :-1]
+            touching[:, :-1] |= territory[:, 1:]
+            return touching & ~territory & (self.state.walls[player] == 0)
+        return self._cached(('frontier', player), ('walls', 'territories'), compute)
+
+    def to_frontier(self, player):
+        """
+        Distance from every cell to the nearest frontier cell of the given player
+        """
+        return self._cached(('to_frontier', player), ('walls', 'territories'),
+                            lambda: bfs_distances(self.frontier(player), self.passable()))
+
+    def from_agents(self):
+        """
+        Distance fields from every agent, shape (num_players, num_agents, height, width),
+        agents in the order of State.agent_coords_in_order.
+        All fields are computed by one batched BFS.
+        """
+        def compute():
+            state = self.state
+            coords = state.agent_coords_in_order
+            sources = np.zeros((state.num_players, state.num_agents, state.height, state.width),
+                               dtype=bool)
+            for player in range(state.num_players):
+                for idx, (x, y) in enumerate(coords[player]):
+                    sources[player, idx, x, y] = True
+            return bfs_distances(sources, self.passable())
+        return self._cached('agents', ('walls', 'agents'), compute)
+
+    def agent_distances(self, field, player=None):
+        """
+        Reads a target field (to_castles(), to_walls(p), ...) at the positions
+        of the agents of a player (the current one by default).
+        :return: int16 array of shape (num_agents,)
+        """
+        if player is None:
+            player = self.state.current_player
+        coords = np.array(self.state.agent_coords_in_order[player]).reshape(-1, 2)
+        return field[coords[:, 0], coords[:, 1]]
@@ -1,7 +1,77 @@
 
 import numpy as np
+from collections.abc import Mapping
+from src import kernels
+from src.context import SummedAreaTables
+from src.features import FEATURE_PLANES, FeaturePlanes
+from src.whatif import WallAnalysis, wall_flip_deltas
 from src.map import Map
-from copy import deepcopy as dcopy
+from copy import copy, deepcopy as dcopy
+
+
+class StateView(Mapping):
+    """
+    Read-only mapping returned by State.get_state().
+    Cheap entries are filled in eagerly, the expensive ones (observation,
+    valid actions, hash and scores) are computed on first access and memoized.
+    A view always describes the state at the version it was created for: when
+    the state is about to change, the view is detached onto a private snapshot.
+    """
+    lazy_fields = {
+        'observation': lambda state, view: state.get_observation(partial=view._partial, padded=view._padded,
+                                                                 features=view._features),
+        'valid_actions': lambda state, view: state.get_valid_actions(),
+        'hash_str': lambda state, view: state.string_representation(),
+        'scores': lambda state, view: state.scores,
+        'context': lambda state, view: state.get_context(),
+    }
+    keys_in_order = ('player-id', 'observation', 'current-agent-id', 'curr_agent_xy',
+                     'valid_actions', 'remaning_turns', 'hash_str', 'scores')
+    
+    def __init__(self, state, partial=True, padded=False, features=False, context=False):
+        self._state = state
+        self._partial = partial
+        self._padded = padded
+        self._features = features
+        self._keys = self.keys_in_order + ('context',) if context else self.keys_in_order
+        self.version = state.version
+        self._values = {
+            'player-id': state.current_player,
+            'current-agent-id': state.agent_current_idx,
+            'curr_agent_xy': state.get_curr_agent(),
+            'remaning_turns': state.remaining_turns,
+        }
+    
+    def __getitem__(self, key):
+        if key in self._values:
+            return self._values[key]
+        if key not in self.lazy_fields or key not in self._keys:
+            raise KeyError(key)
+        value = self.lazy_fields[key](self._state, self)
+        self._values[key] = value
+        return value
+    
+    def __iter__(self):
+        return iter(self._keys)
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def detach(self):
+        """
+        Moves the view onto a snapshot of its state, so the fields that were not
+        read yet still describe the version the view was created for. The
+        scores are read right away, the snapshot only copies the caches the
+        other pending fields use.
+        """
+        pending = [key for key in self._keys if key in self.lazy_fields and key not in self._values]
+        if 'scores' in pending:
+            self._values['scores'] = self._state.scores
+            pending.remove('scores')
+        if pending:
+            self._state = self._state.clone(features=self._features and 'observation' in pending,
+                                            context='context' in pending)
+
 
 class State(Map):
     def __init__(self, configs, action_space):
@@ -19,6 +89,19 @@ class State(Map):
         self.beta = 20 # effect of castle
         self.gamma = 5 # effect of territory
         self.obs_range = configs['obs_range']
+        # grid sizes of the global context maps (src/context.py)
+        self.context_scales = tuple(configs.get('context_scales', (4, 8)))
+        self.players = None
+        # bumped on every mutation, derived data is memoized per version
+        self.version = 0
+        self.layer_versions = {'agents': 0, 'walls': 0, 'territories': 0}
+        self._views = {}
+        self._distance_fields = None
+        self._features = None
+        self._context = None
+        self._wall_analyses = None
+        self._scores = None
+        self._scores_version = -1
         
         self.action_map = {
             ('Move', 'U'): 0,
@@ -48,6 +131,8 @@ class State(Map):
         }
         
         self.n_actions = len(self.action_map.values())
+        self.move_offsets = np.array([self.direction_map[d] for d in action_space['Move']], dtype=np.int64)
+        self.change_offsets = np.array([self.direction_map[d] for d in action_space['Change']], dtype=np.int64)
         
     def hash_arr(self, arr: np.ndarray):
         s = ''.join([str(x) for x in arr.flatten()])
@@ -58,9 +143,9 @@ class State(Map):
         """
         Returns a hash code for string representation of the state
         """
-        players = [self.current_player, self.current_player ^ 1]
-        s = self.hash_arr(self.agents[players]) + self.hash_arr(self.walls[players]) + \
-            self.hash_arr(self.castles) + self.hash_arr(self.territories[players])
+        board = self.perspective()
+        s = self.hash_arr(board[:, 0]) + self.hash_arr(board[:, 1]) + \
+            self.hash_arr(self.castles) + self.hash_arr(board[:, 2])
         return hash(s)    
     
     def current_position(self):
@@ -68,7 +153,130 @@ class State(Map):
         
     def copy(self):
         return dcopy(self)
+    
+    def clone(self, features=True, context=True):
+        """
+        Returns a cheap copy of the state: the mutable layers are copied,
+        the static ones (castles, ponds) and the players are shared.
+        features, context: copy the feature planes / context tables, without
+        them the copy rebuilds them on first use
+        """
+        state = copy(self)
+        state.board = self.board.copy()
+        state.link_board()
+        state.agent_coords_in_order = [list(coords) for coords in self.agent_coords_in_order]
+        state.wall_scores = list(self.wall_scores)
+        state.castle_scores = list(self.castle_scores)
+        state.open_territory_scores = list(self.open_territory_scores)
+        state.closed_territory_scores = list(self.closed_territory_scores)
+        state.territory_scores = list(self.territory_scores)
+        state.layer_versions = dict(self.layer_versions)
+        state._views = {}
+        state._distance_fields = None
+        state._wall_analyses = None
+        state._features = self._features.copy() if features and self._features is not None else None
+        state._context = self._context.copy() if context and self._context is not None else None
+        return state
+    
+    def invalidate(self):
+        """
+        Marks the state as changed. Must be called before mutating the board,
+        views handed out by get_state() are detached and the memoized data dropped.
+        """
+        for view in self._views.values():
+            view.detach()
+        self._views = {}
+        self.version += 1
+    
+    def mark_changed(self, *layers):
+        """
+        Records that the given layers ('agents', 'walls', 'territories') changed
+        in the current version, caches depending on them are dropped on next use.
+        """
+        for layer in layers:
+            self.layer_versions[layer] = self.version
+    
+    def make_random_map(self):
+        self.invalidate()
+        super().make_random_map()
+        self._features = None
+        self._context = None
+        self.mark_changed(*self.layer_versions)
+    
+    def load(self, *args, **kwargs):
+        """
+        Map.load on a state that may be reused: the views and every cache
+        derived from the previous map are dropped
+        """
+        self.invalidate()
+        super().load(*args, **kwargs)
+        self._features = None
+        self._context = None
+        self._distance_fields = None
+        self._wall_analyses = None
+        self.mark_changed(*self.layer_versions)
+    
+    def distance_fields(self):
+        """
+        Returns the DistanceFields of this state (see src/spatial.py)
+        """
+        if self._distance_fields is None:
+            from src.spatial import DistanceFields
+            self._distance_fields = DistanceFields(self)
+        return self._distance_fields
         
+    def feature_planes(self):
+        """
+        Returns the FeaturePlanes of this state (see src/features.py), up to date with its walls
+        """
+        if self._features is None:
+            self._features = FeaturePlanes(self)
+        elif self._features.walls_version != self.layer_versions['walls']:
+            self._features.rebuild(self)
+        return self._features
+    
+    def context_tables(self):
+        """
+        Returns the SummedAreaTables of this state (see src/context.py), up to date with its layers
+        """
+        if self._context is None:
+            self._context = SummedAreaTables(self)
+        return self._context.sync(self)
+    
+    def get_context(self, scales=None, player=None):
+        """
+        Global context maps seen by a player (the current one by default): one
+        (9, g, g) float32 array per grid size g of scales (context_scales by
+        default), see src/context.py
+        """
+        tables = self.context_tables()
+        if player is None:
+            player = self.current_player
+        agent = self.get_curr_agent() if player == self.current_player else None
+        return [tables.pooled(n, player, agent) for n in (scales or self.context_scales)]
+    
+    def wall_flip_deltas(self, cells, player=None):
+        """
+        Exact score deltas of both players for flipping each of the (x, y) cells
+        as a Change action of `player` (the current one by default) would, the
+        state is left untouched. Returns a (len(cells), 2) float array, nan where
+        no wall can be (see src/whatif.py). The connectivity analysis is shared
+        by all cells and memoized until walls or territories change.
+        """
+        versions = (self.layer_versions['walls'], self.layer_versions['territories'])
+        if self._wall_analyses is None or self._wall_analyses[0] != versions:
+            analyses = [WallAnalysis(self.walls[p], self.walls[1 - p], self.territories[p], self.castles)
+                        for p in range(self.num_players)]
+            self._wall_analyses = (versions, analyses)
+        return wall_flip_deltas(self, cells, player, self._wall_analyses[1])
+    
+    def change_action_deltas(self):
+        """
+        wall_flip_deltas() of the cells targeted by the Change actions of the current agent, in action order
+        """
+        x, y = self.get_curr_agent()
+        return self.wall_flip_deltas([(x + dx, y + dy) for dx, dy in self.change_offsets])
+    
     def get_curr_player(self):
         return self.current_player
     
@@ -78,11 +286,19 @@ class State(Map):
         
     @property
     def scores(self):
-        score_A = self.alpha * self.wall_scores[0] + self.beta * self.castle_scores[0] + \
-            self.gamma * (self.open_territory_scores[0] + self.closed_territory_scores[0])
-        score_B = self.alpha * self.wall_scores[1] + self.beta * self.castle_scores[1] + \
-            self.gamma * (self.open_territory_scores[1] + self.closed_territory_scores[1])
-        return np.array([score_A, score_B])
+        """
+        Scores of both players, memoized until the state changes.
+        The returned array is read-only.
+        """
+        if self._scores_version != self.version:
+            score_A = self.alpha * self.wall_scores[0] + self.beta * self.castle_scores[0] + \
+                self.gamma * (self.open_territory_scores[0] + self.closed_territory_scores[0])
+            score_B = self.alpha * self.wall_scores[1] + self.beta * self.castle_scores[1] + \
+                self.gamma * (self.open_territory_scores[1] + self.closed_territory_scores[1])
+            self._scores = np.array([score_A, score_B])
+            self._scores.flags.writeable = False
+            self._scores_version = self.version
+        return self._scores
     
     
     def set_players(self, players):
@@ -91,33 +307,33 @@ class State(Map):
     def get_agent_position(self):
         return self.agent_pos[self.current_player]
     
+    def perspective(self, player=None):
+        """
+        Dynamic layers seen by a player (the current one by default), as a
+        (2, 3, height, width) view [me / opponent, agents / walls / territories]
+        of the board: no copy, the opponent's perspective is the board reversed
+        along its player axis.
+        """
+        if player is None:
+            player = self.current_player
+        return self.board if player == 0 else self.board[::-1]
+    
     def to_opponent(self):
-        state = dcopy(self)
+        """
+        The state with the other player to move. The board is shared, not copied:
+        clone() the result before mutating either state.
+        """
+        state = copy(self)
         state.current_player ^= 1
+        state._views = {}
+        state._distance_fields = None
+        state._wall_analyses = None
         return state
 
-    def transition_matrix(self, matrix, vector):
-        result = []
-        dx, dy = vector
-        rows, cols = len(matrix), len(matrix[0])
-
-        for i in range(rows):
-            row = []
-            for j in range(cols):
-                new_i, new_j = i - dx, j - dy
-                if 0 <= new_i < self.height and 0 <= new_j < self.width:
-                    row.append(matrix[new_i][new_j])
-                else:
-                    row.append(-1)
-            if row:
-                result.append(row)
-
-        return np.array(result)
-
     def terminal(self):
         return self.remaining_turns == 0
     
-    def get_state(self, partial=True):
+    def get_state(self, partial=True, padded=False, features=False, context=False):
         """
         partial = True (default) if you want to get the partial state,
         the environment will return the a matrix of size (self.obs_range x 2 + 1) x (self.obs_range x 2 + 1) 
@@ -136,142 +352,214 @@ class State(Map):
         see function get_state() in src/state.py
         Using env.get_state(partial=False) if you want to get the full state,
         the full state is a matrix of size height x width (observation_shape)
-        """
-        # Standardized variable names to improve readability
-        players = [self.current_player, self.current_player ^ 1]
-        agent_board = self.agents[players]
-        castle_board = self.castles
-        pond_board = self.ponds
-        wall_board = self.walls[players]
-        territory_board = self.territories[players]
-        agent_current_board = np.zeros(agent_board[0].shape)
-        obs = np.stack(
-            (
-                agent_board[0], 
-                wall_board[0], 
-                territory_board[0], 
-                agent_board[1],
-                wall_board[1],
-                territory_board[1],
-                castle_board,
-                pond_board
-            ),
-            axis=0
-        )
         
+        padded = True returns observations of a fixed shape whatever the map size:
+        (9, height-max, width-max) for the full state, (9, S, S) for the partial
+        one, S = 2 x obs_range - 1. The board is aligned on the top-left corner,
+        so padded coordinates are board coordinates; cells outside of the board
+        are -1 and channel 8 is 1 on the board, 0 outside.
         
+        features = True appends the feature planes of src/features.py (neighbour
+        wall counts, border / pond / castle adjacency, diagonal wall links) after
+        the channels above, cropped and padded the same way.
         
-        # Standardized variable names to improve readability and changed key name
-        current_agent_idx = self.agent_current_idx
-        current_agent_coord = self.agent_coords_in_order[self.current_player][current_agent_idx]
+        context = True adds a 'context' entry: coarse maps of the whole board
+        at the grid sizes of context_scales, from get_context().
+        
+        The result is a StateView: 'observation', 'valid_actions', 'hash_str' and
+        'scores' are computed on first access, and the same view is returned
+        until the state changes.
+        """
+        key = (partial, padded, features, context)
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = StateView(self, partial=partial, padded=padded, features=features,
+                                                context=context)
+        return view
+    
+    def get_layers(self, player=None, out=None, rows=slice(None), cols=slice(None)):
+        """
+        Full board layers seen by a player (the current one by default),
+        in the channel order described in get_state(). Only the window
+        [rows, cols] of the board is written into `out` if it is given.
+        """
+        if out is None:
+            out = np.empty((8, self.height, self.width), dtype=np.int8)
+        board = self.perspective(player)
+        # me: agents, walls, territories, then the opponent, then castles and ponds
+        out[0:3] = board[0, :, rows, cols]
+        out[3:6] = board[1, :, rows, cols]
+        out[6] = self.castles[rows, cols]
+        out[7] = self.ponds[rows, cols]
+        return out
+    
+    def get_observation(self, partial=True, padded=False, features=False):
+        """
+        Builds the observation described in get_state(). The layers are
+        written straight into the returned array.
+        """
+        n_features = len(FEATURE_PLANES) if features else 0
+        planes = self.feature_planes() if features else None
+        if not partial:
+            if not padded:
+                obs = np.empty((8 + n_features, self.height, self.width), dtype=np.int8)
+                self.get_layers(out=obs[:8])
+                if features:
+                    planes.write(obs[8:], self.current_player)
+                return obs
+            obs = np.full(self.padded_shape(partial, features), -1, dtype=np.int8)
+            obs[8] = 0
+            self.get_layers(out=obs[:8, :self.height, :self.width])
+            obs[8, :self.height, :self.width] = 1
+            if features:
+                planes.write(obs[9:, :self.height, :self.width], self.current_player)
+            return obs
         
+        # window of obs_range around the current agent, -1 outside of the board
+        x, y = self.get_curr_agent()
+        size = 2 * self.obs_range - 1
+        height, width = min(self.height, size), min(self.width, size)
+        offset_x, offset_y = x - self.obs_range + 1, y - self.obs_range + 1
+        i0, i1 = max(0, -offset_x), min(height, self.height - offset_x)
+        j0, j1 = max(0, -offset_y), min(width, self.width - offset_y)
+        obs = np.full((9 + n_features, height, width), -1, dtype=np.int64)
+        obs[8] = 0
+        if i0 < i1 and j0 < j1:
+            rows = slice(offset_x + i0, offset_x + i1)
+            cols = slice(offset_y + j0, offset_y + j1)
+            self.get_layers(out=obs[:8, i0:i1, j0:j1], rows=rows, cols=cols)
+            obs[8, i0:i1, j0:j1] = 1
+            if features:
+                planes.write(obs[9:, i0:i1, j0:j1], self.current_player, rows, cols)
+        if padded:
+            obs = self.pad_observation(obs, partial)
+        return obs
+    
+    def padded_shape(self, partial=True, features=False):
+        """
+        Shape of the observations of get_state(partial, padded=True, features),
+        the same for every map of the configs
+        """
+        n_channels = 9 + (len(FEATURE_PLANES) if features else 0)
         if partial:
-            # crop obs to obs_range
-            transision_vector = (self.obs_range - 1 - current_agent_coord[0], 
-                                self.obs_range - 1 - current_agent_coord[1])
-            for i, matrix in enumerate(obs):
-                obs[i] = self.transition_matrix(matrix, transision_vector)
-                
-            obs = obs[:, :self.obs_range*2-1, :self.obs_range*2-1]
-            masked_obs = [(obs[0] != -1) * 1]
-            obs = np.concatenate([obs, masked_obs], axis=0)
-            agent_current_board[current_agent_coord[0], current_agent_coord[1]] = 1
+            size = 2 * self.obs_range - 1
+            return (n_channels, size, size)
+        return (n_channels, self.height_max, self.width_max)
+    
+    def pad_observation(self, obs, partial=True, out=None):
+        """
+        Pads an observation to padded_shape(), top-left aligned. A full-board
+        observation (no validity channel) gets it inserted as channel 8.
+        Writes into `out` (e.g. a slot of a preallocated batch) if given.
+        """
+        n_channels = len(obs) if partial else len(obs) + 1
+        shape = (n_channels,) + self.padded_shape(partial)[1:]
+        if out is None:
+            out = np.empty(shape, dtype=np.int8)
+        height, width = obs.shape[1:]
+        out[:] = -1
+        out[8] = 0
+        if partial:
+            out[:, :height, :width] = obs
+        else:
+            out[:8, :height, :width] = obs[:8]
+            out[8, :height, :width] = 1
+            out[9:, :height, :width] = obs[8:]
+        return out
+    
+    def padded_to_board(self, x, y):
+        """
+        Board coordinates of a cell of a padded full-board observation, None if it is padding
+        """
+        if 0 <= x < self.height and 0 <= y < self.width:
+            return x, y
+        return None
+    
+    def get_team_state(self, player=None):
+        """
+        Partial observations and valid actions of every agent of a player (the
+        current one by default) in one call, as if each agent was the current one:
+        'observations' is (num_agents, 9, S, S) and 'valid_actions' (num_agents, n_actions).
+        All windows are taken from one padded board.
+        """
+        if player is None:
+            player = self.current_player
+        layers = self.get_layers(player)
+        n_layers, height, width = layers.shape
+        size = 2 * self.obs_range - 1
+        pad = self.obs_range - 1
+        padded = np.full((n_layers + 1, height + 2 * pad, width + 2 * pad), -1, dtype=layers.dtype)
+        padded[:n_layers, pad:pad + height, pad:pad + width] = layers
+        # last channel: 1 inside the board, 0 outside
+        padded[n_layers] = 0
+        padded[n_layers, pad:pad + height, pad:pad + width] = 1
+        windows = np.lib.stride_tricks.sliding_window_view(
+            padded, (min(height, size), min(width, size)), axis=(1, 2))
         
-        valid_actions = np.zeros(len(self.action_map.values()), dtype=bool)
-        for action in list(self.action_map.values()):
-            if self.is_valid_action(action):
-                valid_actions[action] = True
-        if sum(valid_actions) == 0:
-            for action in list(self.action_map.values()):
-                if self.is_valid_action(action, drop_self=True):
-                    valid_actions[action] = True
-            
+        coords = np.array(self.agent_coords_in_order[player], dtype=np.int64).reshape(-1, 2)
+        observations = np.ascontiguousarray(
+            windows[:, coords[:, 0], coords[:, 1]].transpose(1, 0, 2, 3), dtype=np.int64)
+        
+        occupied = self.occupied_board()
+        valid_actions = np.zeros((len(coords), self.n_actions), dtype=bool)
+        for idx, (x, y) in enumerate(coords):
+            for drop_self in (False, True):
+                valid_actions[idx] = kernels.valid_action_mask(
+                    player, x, y, self.agents, self.walls, self.castles, self.ponds, occupied,
+                    self.move_offsets, self.change_offsets, drop_self)
+                if valid_actions[idx].any():
+                    break
         return {
-            'player-id': self.current_player,
-            'observation': obs, 
-            'current-agent-id': current_agent_idx,
-            'curr_agent_xy': dcopy(current_agent_coord),
+            'player-id': player,
+            'observations': observations,
             'valid_actions': valid_actions,
+            'agents_xy': [tuple(xy) for xy in coords.tolist()],
             'remaning_turns': self.remaining_turns,
-            'hash_str': self.string_representation(),
-            }
+        }
+    
+    def get_valid_actions(self):
+        """
+        Returns a boolean mask of the valid actions of the current agent.
+        If no action is valid, changes on the agent's own walls are allowed.
+        """
+        valid_actions = self.valid_action_mask()
+        if not valid_actions.any():
+            valid_actions = self.valid_action_mask(drop_self=True)
+        return valid_actions
+    
+    def occupied_board(self):
+        """
+        Cells holding an agent according to agent_coords_in_order
+        """
+        occupied = np.zeros((self.height, self.width), dtype=np.int8)
+        for coords in self.agent_coords_in_order:
+            for x, y in coords:
+                occupied[x, y] = 1
+        return occupied
+    
+    def valid_action_mask(self, drop_self=False):
+        """
+        Boolean mask of is_valid_action(action, drop_self) over all actions
+        """
+        x, y = self.get_curr_agent()
+        return kernels.valid_action_mask(self.current_player, x, y, self.agents, self.walls,
+                                         self.castles, self.ponds, self.occupied_board(),
+                                         self.move_offsets, self.change_offsets, drop_self)
 
     def get_scores(self, player):
         """
         Recalculates the score of the current player based on current state
         """
-        dx = [0, 0, 1, -1]
-        dy = [1, -1, 0, 0]
-        
-        height = self.height
-        width = self.width
-        avail = np.zeros((height, width), dtype=int)
-        st = []
         opponent = 1 - player
-        
-        def validate(x, y):
-            # if the current land is out of table bounds
-            if x >= height or x < 0 or y >= width or y < 0:
-                return False
-            # if the current land is visited
-            if avail[x][y]:
-                return False
-            # if the current land is a wall
-            if self.walls[player][x][y]:
-                return False
-            return True
-        
-        for i in range(height):
-            if validate(i, 0):
-                st.append((i, 0))
-                avail[i][0] = 1
-            if validate(i, width - 1):
-                st.append((i, width - 1))
-                avail[i][width - 1] = 1
-        
-        for j in range(width):
-            if validate(0, j):
-                st.append((0, j))
-                avail[0][j] = 1
-            if validate(height - 1, j):
-                st.append((height - 1, j))
-                avail[height - 1][j] = 1
-            
-        while len(st) > 0:
-            x, y = st.pop()
-            for i in range(4):
-                nx = x + dx[i]
-                ny = y + dy[i]
-                if validate(nx, ny):
-                    avail[nx][ny] = 1
-                    st.append((nx, ny))
-        
-        wall_score = self.walls[player].sum()
-        
-        closed_territory_score = height * width - avail.sum() - wall_score
-
-        castle_score = 0
-        
-        for i in range(height):
-            for j in range(width):
-                if self.walls[opponent][i][j] == 1 and self.territories[player][i][j] == 1:
-                    self.territories[player][i][j] = 0
-                if avail[i][j] == 0 and self.walls[player][i][j] == 0:
-                    self.territories[player][i][j] = 1
-                    if self.castles[i][j] == 1:
-                        castle_score += 1
-        
-        all_territory_score = self.territories[player].sum()
-        
-        open_territory_score = all_territory_score - closed_territory_score
-        
-
-        return wall_score, closed_territory_score, open_territory_score, castle_score
+        return kernels.player_scores(self.walls[player], self.walls[opponent],
+                                     self.territories[player], self.castles)
     
     def update_score(self):
         """
         Updates the score of the current player based on current state
         """
+        self.invalidate()
+        self.mark_changed('territories')
         for player in range(self.num_players):
             wall_score, closed_territory_score, open_territory_score, castle_score = self.get_scores(player)
             self.wall_scores[player] = wall_score
@@ -280,8 +568,10 @@ class State(Map):
             self.territory_scores[player] = open_territory_score + closed_territory_score
             self.castle_scores[player] = castle_score
             
-        for player in range(self.num_players):
-            self.players[player].scores = self.scores[player]
+        if self.players is not None:
+            scores = self.scores
+            for player in range(self.num_players):
+                self.players[player].scores = scores[player]
     
     def get_type_action(self, action):
         """
@@ -302,62 +592,9 @@ class State(Map):
             return ('Stay',)
     
     def is_valid_action(self, action, drop_self=False):
-        current_player = self.current_player
-        agent_coords_in_order = self.agent_coords_in_order
-        agent_current_idx = self.agent_current_idx
-        current_position = agent_coords_in_order[current_player][agent_current_idx]
-        
-        valid = True
-        action_type = self.get_type_action(action)
-        if action_type[0] == 'Move':
-            direction = action_type[1]
-            next_position = (self.direction_map[direction][0] + current_position[0],
-                        self.direction_map[direction][1] + current_position[1])
-            if not self.in_bounds(next_position[0], next_position[1]):
-                valid = False
-                
-            elif next_position in self.agent_coords_in_order[0] or \
-                        next_position in self.agent_coords_in_order[1]:
-                valid = False
-                
-            elif self.agents[current_player][next_position[0]][next_position[1]] == 1:
-                ''' in turn (N agent actions at the same time), only one agent can move at an area, 
-                    so the other agent is moved into the same area befores
-                    agents save next coordinates but agent_coords_in_order is not updated to check this '''
-                valid = False
-                
-            elif self.ponds[next_position[0]][next_position[1]] == 1:
-                valid = False
-                
-            elif self.walls[0][next_position[0]][next_position[1]] == 1 \
-                    or self.walls[1][next_position[0]][next_position[1]] == 1:
-                valid = False
-                
-            elif self.castles[next_position[0]][next_position[1]] == 1:
-                valid = False
-    
-        elif action_type[0] == 'Change':
-            direction = action_type[1]
-            next_position = (self.direction_map[direction][0] + current_position[0],
-                        self.direction_map[direction][1] + current_position[1])
-            if not self.in_bounds(next_position[0], next_position[1]):
-                valid = False
-                
-            elif self.castles[next_position[0]][next_position[1]] == 1:
-                valid = False
-                
-            elif self.ponds[next_position[0]][next_position[1]] == 1:
-                valid = False
-                
-            elif next_position in self.agent_coords_in_order[0] or \
-                        next_position in self.agent_coords_in_order[1]:
-                valid = False
-            elif not drop_self and self.walls[current_player][next_position[0]][next_position[1]] == 1:
-                valid = False
-        else:
-            valid = False
-                
-        return valid
+        if not 0 <= action < self.n_actions:
+            return False
+        return bool(self.valid_action_mask(drop_self=drop_self)[action])
     
     
     def is_terminal(self):
@@ -377,6 +614,7 @@ class State(Map):
         current_position = agent_coords_in_order[current_player][agent_current_idx]
         
         is_valid = self.is_valid_action(action, drop_self=True)
+        self.invalidate()
         
         if is_valid:
             if action_type[0] == 'Move':
@@ -386,18 +624,30 @@ class State(Map):
                 
                 self.agents[current_player][next_position[0]][next_position[1]] = 1
                 self.agents[current_player][current_position[0]][current_position[1]] = 0
+                self.mark_changed('agents')
                 
             elif action_type[0] == 'Change':
                 direction = action_type[1]
                 wall_coord = (self.direction_map[direction][0] + current_position[0],
                             self.direction_map[direction][1] + current_position[1])
+                features = self._features
+                if features is not None and features.walls_version != self.layer_versions['walls']:
+                    features = None
                 if self.walls[0][wall_coord[0]][wall_coord[1]] == 0 \
                             and self.walls[1][wall_coord[0]][wall_coord[1]] == 0:
                     self.walls[current_player][wall_coord[0]][wall_coord[1]] = 1
+                    if features is not None:
+                        features.update_wall(current_player, wall_coord[0], wall_coord[1], 1)
                 
                 else:
+                    if features is not None:
+                        owner = 0 if self.walls[0][wall_coord[0]][wall_coord[1]] else 1
+                        features.update_wall(owner, wall_coord[0], wall_coord[1], -1)
                     self.walls[0][wall_coord[0]][wall_coord[1]] = 0
                     self.walls[1][wall_coord[0]][wall_coord[1]] = 0
+                self.mark_changed('walls')
+                if features is not None:
+                    features.walls_version = self.layer_versions['walls']
             else:
                 pass
             
@@ -407,6 +657,7 @@ class State(Map):
         if self.agent_current_idx == 0:
             self.current_player = (self.current_player + 1) % self.num_players
             self.update_agent_coords_in_order()
+            self.mark_changed('agents')
             if self.current_player == 0:
                 self.remaining_turns -= 1
                 
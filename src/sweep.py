@@ -0,0 +1,291 @@
+"""
+Parallel hyperparameter sweep of agent weights.
+
+A sweep file describes the candidate agent, the values to try for its
+weights and the reference opponents (see configs/sweep.json):
+    {"candidate": {"agent": "algorithms.StupidMove:StupidMove", "param": "weights",
+                   "space": {"change_wall_adjacent": [1.5, 2.1, 3.0], "stay": [-0.9, -2.0]}},
+     "opponents": [{"agent": "algorithms.StupidMove:StupidMove"},
+                   {"agent": "algorithms.RandomStep:RandomStep"}],
+     "samples": 0}
+Every combination of the space is a configuration (or `samples` random
+ones), the first configuration is the agent's defaults (the "defaults" of
+the spec, or the DEFAULT_WEIGHTS of the agent's module) and a combination
+equal to them is not played twice. "param" is the
+keyword argument receiving the weights; with "order": [...] they are passed
+as a tuple in that order ("defaults" fills the names missing from a
+configuration), e.g. the (wall, castle, territory) evaluation weights of
+AlphaBeta:
+    {"agent": "algorithms.AlphaBeta:AlphaBeta", "param": "weights", "order": ["wall", "castle", "territory"],
+     "defaults": {"wall": 1, "castle": 20, "territory": 5}, "kwargs": {"time_limit": 0.05},
+     "space": {"wall": [1, 2], "castle": [10, 20, 40]}}
+
+Games are played in pairs: with the same seed, so on the same map and with
+the same random draws, the candidate plays once as each player. Every
+configuration plays the same seeds, so differences between configurations
+are not map luck. A pair scores the candidate's points (1 win, 0.5 draw)
+averaged over both games.
+
+Successive halving: round r plays pairs * eta^r new pairs against every
+opponent, then only the best 1/eta configurations (by mean points, then
+score margin) go on, until one is left or the rounds are done.
+
+Usage: python -m src.sweep configs/sweep.json --workers 8 --out sweep.csv
+"""
+import csv
+import json
+import math
+import random
+import itertools
+from importlib import import_module
+from argparse import ArgumentParser
+import multiprocessing
+
+import numpy as np
+
+from src import kernels
+from src.environment import AgentFighting
+from src.selfplay import load_agent
+from src.utils import seeded
+
+
+def agent_kwargs(spec, values=None):
+    """
+    Keyword arguments of an agent spec, with the weights of a configuration
+    """
+    kwargs = dict(spec.get('kwargs', {}))
+    if values:
+        order = spec.get('order')
+        if order is None:
+            kwargs[spec['param']] = dict(values)
+        else:
+            defaults = spec.get('defaults', {})
+            kwargs[spec['param']] = tuple(values.get(name, defaults.get(name)) for name in order)
+    return kwargs
+
+
+def agent_defaults(spec):
+    """
+    Default weights of an agent spec: its "defaults", else the DEFAULT_WEIGHTS of the agent's module
+    """
+    if 'defaults' in spec:
+        return spec['defaults']
+    return getattr(import_module(spec['agent'].split(':')[0]), 'DEFAULT_WEIGHTS', {})
+
+
+def build_agent(spec, env, values=None):
+    return load_agent(spec['agent'])(n_actions=env.n_actions, num_agents=env.num_agents,
+                                     **agent_kwargs(spec, values))
+
+
+def configurations(space, samples=0, seed=0, include_default=True, defaults=None):
+    """
+    Dicts of weights: every combination of the space, or `samples` random ones
+    :param include_default: the first configuration is {}, the agent's defaults
+    :param defaults: default weights of the agent, the combination equal to them is dropped with include_default
+    """
+    names = sorted(space)
+    sizes = [len(space[name]) for name in names]
+    total = int(np.prod(sizes)) if names else 0
+    if samples and samples < total:
+        # mixed-radix decoding of distinct random indices, the grid is never enumerated
+        indices = random.Random(seed).sample(range(total), samples)
+        combinations = []
+        for index in indices:
+            combination = []
+            for size in reversed(sizes):
+                index, digit = divmod(index, size)
+                combination.append(digit)
+            combinations.append(reversed(combination))
+        candidates = [{name: space[name][digit] for name, digit in zip(names, combination)}
+                   for combination in combinations]
+    else:
+        candidates = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if include_default:
+        defaults = defaults or {}
+        candidates = [values for values in candidates
+                      if any(name not in defaults or defaults[name] != value for name, value in values.items())]
+        candidates.insert(0, {})
+    return candidates
+
+
+def play_game(seed, configs, specs, values):
+    """
+    Final scores of one game between the agents of specs (player 0, player 1)
+    :param values: weights of each player's configuration, None for the spec's own
+    """
+    with seeded(seed):
+        env = AgentFighting(None, configs, render=False)
+        agents = [build_agent(spec, env, value) for spec, value in zip(specs, values)]
+        state = env.get_state()
+        while not env.is_terminal():
+            agent = agents[state['player-id']]
+            # search agents (AlphaBeta) need the State object
+            action = agent.get_action(env.state if hasattr(agent, 'iter_actions') else state)
+            state, _, _ = env.step(action)
+        return tuple(int(score) for score in env.state.scores)
+
+
+def play_pair(task):
+    """
+    The candidate with weights `values` against an opponent on one seed, once as each player.
+    Returns (config, opponent, seed, points, margin) from the candidate's side.
+    """
+    config, values, candidate, opponent_id, opponent, seed, configs = task
+    points, margin = 0.0, 0.0
+    for side in (0, 1):
+        specs = (candidate, opponent) if side == 0 else (opponent, candidate)
+        scores = play_game(seed, configs, specs, (values, None) if side == 0 else (None, values))
+        diff = scores[side] - scores[1 - side]
+        points += 1.0 if diff > 0 else 0.5 if diff == 0 else 0.0
+        margin += diff
+    return config, opponent_id, seed, points / 2, margin / 2
+
+
+class Sweep(object):
+    """
+    :param candidate: agent spec of the candidate, with its 'space'
+    :param configs: configs of the environment, as configs/map.json
+    :param candidates: weights of the configurations to compare, configurations() of the space by default
+    :param opponents: agent specs of the reference opponents
+    :param pairs: pairs of games per opponent in the first round
+    :param eta: fraction of configurations dropped per round is 1 - 1/eta, the pairs are multiplied by eta
+    :param rounds: maximum number of rounds, until one configuration is left if None
+    :param workers: processes of the pool, 0 to play in the current process
+    """
+    def __init__(self, candidate, opponents, configs, candidates=None, pairs=4, eta=2, rounds=None,
+                 workers=None, seed=0):
+        self.candidate = candidate
+        self.opponents = opponents
+        self.configs = configs
+        self.candidates = candidates if candidates is not None else configurations(
+            candidate.get('space', {}), defaults=agent_defaults(candidate))
+        self.pairs = pairs
+        self.eta = eta
+        self.rounds = rounds
+        self.workers = workers
+        self.seed = seed
+        # per configuration: pair points and margins, round reached
+        self.points = [[] for _ in self.candidates]
+        self.margins = [[] for _ in self.candidates]
+        self.reached = [0] * len(self.candidates)
+
+    def _tasks(self, alive, seeds):
+        for config in alive:
+            for opponent_id, opponent in enumerate(self.opponents):
+                for seed in seeds:
+                    yield (config, self.candidates[config], self.candidate, opponent_id, opponent, seed,
+                           self.configs)
+
+    def _play(self, tasks, pool):
+        if pool is None:
+            return map(play_pair, tasks)
+        return pool.imap_unordered(play_pair, tasks, chunksize=1)
+
+    def mean(self, config):
+        return (np.mean(self.points[config]) if self.points[config] else float('nan'),
+                np.mean(self.margins[config]) if self.margins[config] else float('nan'))
+
+    def run(self, log=print):
+        alive = list(range(len(self.candidates)))
+        next_seed = self.seed
+        pool = None
+        if self.workers != 0:
+            pool = multiprocessing.Pool(self.workers, initializer=kernels.precompile)
+        try:
+            round_index = 0
+            while alive and (self.rounds is None or round_index < self.rounds):
+                n_pairs = self.pairs * self.eta ** round_index
+                seeds = range(next_seed, next_seed + n_pairs)
+                next_seed += n_pairs
+                for config, _, _, points, margin in self._play(self._tasks(alive, seeds), pool):
+                    self.points[config].append(points)
+                    self.margins[config].append(margin)
+                for config in alive:
+                    self.reached[config] = round_index + 1
+                alive.sort(key=lambda config: self.mean(config), reverse=True)
+                if log is not None:
+                    best = alive[0]
+                    log('round {}: {} configurations x {} pairs, best #{} {:.3f} points'.format(
+                        round_index + 1, len(alive), n_pairs * len(self.opponents), best, self.mean(best)[0]))
+                round_index += 1
+                if len(alive) == 1:
+                    break
+                alive = alive[:max(1, math.ceil(len(alive) / self.eta))]
+                if len(alive) == 1:
+                    # the winner of the last halving is not played alone
+                    self.reached[alive[0]] += 1
+                    break
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return self.table()
+
+    def table(self):
+        """
+        Rows of every configuration, ranked by round reached, then mean points and margin
+        """
+        rows = []
+        for config, values in enumerate(self.candidates):
+            points, margin = self.mean(config)
+            n = len(self.points[config])
+            rows.append({
+                'config': config,
+                'round': self.reached[config],
+                'pairs': n,
+                'points': points,
+                'stderr': np.std(self.points[config], ddof=1) / np.sqrt(n) if n > 1 else float('nan'),
+                'margin': margin,
+                'weights': json.dumps(values, sort_keys=True) if values else 'default',
+            })
+        rows.sort(key=lambda row: (row['round'], row['points'], row['margin']), reverse=True)
+        for rank, row in enumerate(rows):
+            row['rank'] = rank + 1
+        return rows
+
+
+TABLE_COLUMNS = ('rank', 'config', 'round', 'pairs', 'points', 'stderr', 'margin', 'weights')
+
+
+def format_table(rows):
+    lines = ['{:>4} {:>6} {:>5} {:>6} {:>7} {:>7} {:>9}  {}'.format(*TABLE_COLUMNS)]
+    for row in rows:
+        lines.append('{rank:>4} {config:>6} {round:>5} {pairs:>6} {points:>7.3f} {stderr:>7.3f} {margin:>9.1f}  '
+                     '{weights}'.format(**row))
+    return '\n'.join(lines)
+
+
+def argument_parser():
+    parser = ArgumentParser()
+    parser.add_argument('sweep', help='Sweep file, see src/sweep.py')
+    parser.add_argument('--configs', default='configs/map.json')
+    parser.add_argument('--pairs', type=int, default=4, help='Pairs of games per opponent in the first round')
+    parser.add_argument('--eta', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0, help='First game seed, and seed of the sampled configurations')
+    parser.add_argument('--out', default=None, help='CSV file of the ranked table')
+    return parser.parse_args()
+
+
+def main():
+    args = argument_parser()
+    sweep_file = json.load(open(args.sweep))
+    configs = json.load(open(args.configs))
+    candidate = sweep_file['candidate']
+    candidates = configurations(candidate.get('space', {}), sweep_file.get('samples', 0), args.seed,
+                                sweep_file.get('include_default', True), agent_defaults(candidate))
+    sweep = Sweep(candidate, sweep_file['opponents'], configs, candidates=candidates, pairs=args.pairs,
+                  eta=args.eta, rounds=args.rounds, workers=args.workers, seed=args.seed)
+    rows = sweep.run()
+    print(format_table(rows))
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=TABLE_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
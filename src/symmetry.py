@@ -0,0 +1,75 @@
+"""
+The 8 symmetries of the square board (4 rotations, with or without a
+left-right flip) applied to observations and to per-action vectors
+(policies, valid action masks, action indices).
+
+A transform t in range(8) is (k, flip) = (t % 4, t >= 4): the board is
+first flipped left-right if flip, then rotated k times counterclockwise
+with np.rot90, as done by AgentFighting.rotate / AgentFighting.flip.
+"""
+import numpy as np
+
+N_TRANSFORMS = 8
+
+
+def transform_params(t):
+    return t % 4, t >= 4
+
+
+def transform_direction(vector, t):
+    """
+    Image of a (dx, dy) direction under transform t
+    """
+    k, flip = transform_params(t)
+    dx, dy = vector
+    if flip:
+        dy = -dy
+    for _ in range(k):
+        # np.rot90 maps the cell (i, j) to (n - 1 - j, i)
+        dx, dy = -dy, dx
+    return dx, dy
+
+
+def transform_board(obs, t):
+    """
+    Applies transform t to the last two axes of obs (any number of leading axes)
+    """
+    k, flip = transform_params(t)
+    if flip:
+        obs = np.flip(obs, axis=-1)
+    return np.rot90(obs, k=k, axes=(-2, -1))
+
+
+class Symmetry(object):
+    """
+    Action permutations of the 8 transforms for a given action layout,
+    e.g. Symmetry(state.action_map, state.direction_map).
+    permutations[t][a] is the action that a becomes under transform t.
+    """
+    def __init__(self, action_map, direction_map):
+        n_actions = len(action_map)
+        direction_of = {vector: name for name, vector in direction_map.items()}
+        self.permutations = np.zeros((N_TRANSFORMS, n_actions), dtype=np.int64)
+        self.inverses = np.zeros((N_TRANSFORMS, n_actions), dtype=np.int64)
+        for t in range(N_TRANSFORMS):
+            for (action_type, direction), action in action_map.items():
+                if direction in direction_map:
+                    vector = transform_direction(direction_map[direction], t)
+                    action_t = action_map[(action_type, direction_of[vector])]
+                else:
+                    action_t = action
+                self.permutations[t, action] = action_t
+            self.inverses[t, self.permutations[t]] = np.arange(n_actions)
+
+    def transform_action(self, action, t):
+        return self.permutations[t][action]
+
+    def transform_actions(self, values, t):
+        """
+        Reorders a per-action vector (policy, valid mask) of shape (..., n_actions)
+        so that entry a' of the result is the value of the action mapped to a'.
+        """
+        return np.asarray(values)[..., self.inverses[t]]
+
+    def transform(self, obs, values, t):
+        return transform_board(obs, t), self.transform_actions(values, t)
@@ -0,0 +1,90 @@
+"""
+Batched export of environment outputs into preallocated torch tensors.
+
+The tensors live in shared memory, so DataLoader workers and the training
+loop can read them without copying. The environment side writes straight
+into the shared storage through NumPy views, observations are converted to
+the tensor dtype during that single copy.
+"""
+import numpy as np
+
+from src.utils import get_torch
+
+# through get_torch() so an earlier set_seed() applies
+torch = get_torch()
+
+
+class SharedBatch(object):
+    """
+    Fixed-size batch of observations, valid action masks, rewards and done flags.
+    Can be used directly as a map-style dataset: batch[i] returns the tensors of slot i.
+    """
+    def __init__(self, batch_size, obs_shape, n_actions, obs_dtype=torch.float32):
+        self.batch_size = batch_size
+        self.obs_shape = tuple(obs_shape)
+        self.n_actions = n_actions
+        self.observations = torch.zeros((batch_size,) + self.obs_shape, dtype=obs_dtype).share_memory_()
+        self.valid_actions = torch.zeros((batch_size, n_actions), dtype=torch.bool).share_memory_()
+        self.rewards = torch.zeros(batch_size, dtype=torch.float32).share_memory_()
+        self.dones = torch.zeros(batch_size, dtype=torch.bool).share_memory_()
+        self._bind_views()
+
+    @classmethod
+    def from_env(cls, env, batch_size, partial=True, obs_dtype=torch.float32, padded=False, features=False):
+        """
+        Allocates a batch matching the observations of an AgentFighting env,
+        padded=True fits every map size of its configs (see State.get_state)
+        """
+        obs_shape = env.get_state(partial=partial, padded=padded, features=features)['observation'].shape
+        return cls(batch_size, obs_shape, env.n_actions, obs_dtype=obs_dtype)
+
+    def _bind_views(self):
+        self._observations = self.observations.numpy()
+        self._valid_actions = self.valid_actions.numpy()
+        self._rewards = self.rewards.numpy()
+        self._dones = self.dones.numpy()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_observations', '_valid_actions', '_rewards', '_dones'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind_views()
+
+    def __len__(self):
+        return self.batch_size
+
+    def __getitem__(self, index):
+        return self.observations[index], self.valid_actions[index], \
+            self.rewards[index], self.dones[index]
+
+    def write(self, index, state, reward=0.0, done=False):
+        """
+        Writes the output of env.get_state() / env.step() into slot `index`
+        """
+        np.copyto(self._observations[index], state['observation'], casting='unsafe')
+        self._valid_actions[index] = state['valid_actions']
+        self._rewards[index] = reward
+        self._dones[index] = done
+
+    def write_batch(self, states, rewards=None, dones=None, start=0):
+        """
+        Writes consecutive slots starting at `start`, returns the index after the last one
+        """
+        index = start
+        for i, state in enumerate(states):
+            self.write(index, state,
+                       reward=0.0 if rewards is None else rewards[i],
+                       done=False if dones is None else dones[i])
+            index += 1
+        return index
+
+    def to(self, device, non_blocking=True):
+        """
+        Copies the batch to a device for training, returns the four tensors
+        """
+        return tuple(t.to(device, non_blocking=non_blocking)
+                     for t in (self.observations, self.valid_actions, self.rewards, self.dones))
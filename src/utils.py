@@ -3,19 +3,71 @@
 """
 
 import numbers
+from contextlib import contextmanager
 import numpy as np
 import random
 import os
-import torch
-import shutil
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.style.use('ggplot')
+import sys
+
+# torch and matplotlib are heavy, they are imported on first use only so that
+# the simulation core stays importable with NumPy alone
+
+# seed of the last set_seed() call not applied to torch yet
+_torch_seed = None
+
+
+def get_torch():
+	"""
+	Imports torch, applying the seed of an earlier set_seed() the first time
+	"""
+	global _torch_seed
+	import torch
+	if _torch_seed is not None:
+		torch.manual_seed(_torch_seed)
+		_torch_seed = None
+	return torch
+
+
+def get_pyplot():
+	"""
+	Imports matplotlib.pyplot, applying the ggplot style the first time
+	"""
+	if 'matplotlib.pyplot' not in sys.modules:
+		import matplotlib
+		matplotlib.style.use('ggplot')
+	import matplotlib.pyplot as plt
+	return plt
+
 
 def set_seed(seed):
-	torch.manual_seed(seed)
+	"""
+	Seeds random, numpy and torch. If torch is not imported yet, the seed is
+	applied when get_torch() first imports it.
+	"""
+	global _torch_seed
+	if 'torch' in sys.modules:
+		sys.modules['torch'].manual_seed(seed)
+		_torch_seed = None
+	else:
+		_torch_seed = seed
 	np.random.seed(seed)
 	random.seed(seed)
+
+
+@contextmanager
+def seeded(seed):
+	"""
+	Seeds random and numpy for the body of the with statement, the global
+	random states of the caller are restored afterwards
+	"""
+	states = random.getstate(), np.random.get_state()
+	random.seed(seed)
+	np.random.seed(seed % 2 ** 32)
+	try:
+		yield
+	finally:
+		random.setstate(states[0])
+		np.random.set_state(states[1])
     
 class dotdict(dict):
     def __getattr__(self, name):
@@ -25,6 +77,7 @@ def dtanh(x):
     return 1 / np.cosh(x) ** (0.2)
 
 def plot_elo(ratings, save_dir):
+    plt = get_pyplot()
     fig, ax = plt.subplots()
     ax.plot(ratings)
     ax.set_xlabel('Episodes (x20)')
@@ -74,18 +127,32 @@ def hard_update(target, source):
 			target_param.data.copy_(param.data)
 
 
+_checkpoint_writer = None
+
+
 def save_training_checkpoint(state, is_best, episode_count):
 	"""
-	Saves the models, with all training parameters intact
+	Saves the models, with all training parameters intact. The checkpoint is
+	written in the background by a src.checkpoint.CheckpointWriter of the
+	current directory, call get_checkpoint_writer().flush() to wait for it.
 	:param state:
 	:param is_best:
-	:param filename:
-	:return:
+	:param episode_count:
+	:return: Future of the checkpoint path
 	"""
-	filename = str(episode_count) + 'checkpoint.path.rar'
-	torch.save(state, filename)
-	if is_best:
-		shutil.copyfile(filename, 'model_best.pth.tar')
+	return get_checkpoint_writer().save(state, episode_count, is_best)
+
+
+def get_checkpoint_writer():
+	"""
+	Writer used by save_training_checkpoint, keeps every checkpoint like it always did
+	"""
+	global _checkpoint_writer
+	if _checkpoint_writer is None:
+		from src.checkpoint import CheckpointWriter
+		_checkpoint_writer = CheckpointWriter('.', keep_last=None, pattern='{episode}checkpoint.path.rar',
+											  best_name='model_best.pth.tar')
+	return _checkpoint_writer
 
 
 # Based on http://math.stackexchange.com/questions/1287634/implementing-ornstein-uhlenbeck-in-matlab
@@ -108,6 +175,7 @@ class OrnsteinUhlenbeckActionNoise:
 		return self.X
 
 def plot_timeseries(history, save_dir, x_label, y_label, title):
+    plt = get_pyplot()
     fig, ax = plt.subplots()
     ax.plot(history)
     ax.set_xlabel(x_label)
@@ -117,14 +185,3 @@ def plot_timeseries(history, save_dir, x_label, y_label, title):
     save_path = os.path.join(save_dir, title + '.png')
     plt.savefig(save_path)
     plt.close()
-    
-def plot_timeseries(history, save_dir, x_label, y_label, title):
-    fig, ax = plt.subplots()
-    ax.plot(history)
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
-    ax.set_title(title)
-    ax.grid(True)
-    save_path = os.path.join(save_dir, title + '.png')
-    plt.savefig(save_path)
-    plt.close()
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+Bounded-memory visit counting of observations, for loop detection and
+novelty bonuses over long runs.
+
+Observations are keyed by a 128-bit BLAKE2b digest of their bytes, which is
+stable across processes. Two counting modes keep the memory fixed:
+- 'cms': count-min sketch, never under-counts, may over-count on collisions
+- 'lru': exact counts of the `capacity` most recently seen observations
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+def obs_key(obs):
+    """
+    Fast 128-bit key of an observation (array of any shape and dtype).
+    Integer boards are hashed as int8 planes, their values are small.
+    """
+    obs = np.asarray(obs)
+    if obs.dtype.kind in 'iub':
+        obs = obs.astype(np.int8)
+    else:
+        obs = np.ascontiguousarray(obs)
+    digest = hashlib.blake2b(obs.tobytes(), digest_size=16)
+    digest.update(str(obs.shape).encode())
+    return int.from_bytes(digest.digest(), 'little')
+
+
+class CountMinSketch(object):
+    def __init__(self, width=2 ** 16, depth=4):
+        if width & (width - 1):
+            raise ValueError('width must be a power of two')
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+
+    def _index(self, key):
+        h1 = key & 0xFFFFFFFFFFFFFFFF
+        h2 = (key >> 64) | 1
+        mask = self.width - 1
+        return [(h1 + i * h2) & mask for i in range(self.depth)]
+
+    def add(self, key, count=1):
+        table = self.table
+        result = None
+        for i, j in enumerate(self._index(key)):
+            value = int(table[i, j]) + count
+            table[i, j] = value
+            result = value if result is None else min(result, value)
+        return result
+
+    def count(self, key):
+        table = self.table
+        return min(int(table[i, j]) for i, j in enumerate(self._index(key)))
+
+    def clear(self):
+        self.table[:] = 0
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+
+class LRUCounter(object):
+    def __init__(self, capacity=2 ** 16):
+        self.capacity = capacity
+        self.counts = OrderedDict()
+
+    def add(self, key, count=1):
+        counts = self.counts
+        value = counts.pop(key, 0) + count
+        counts[key] = value
+        if len(counts) > self.capacity:
+            counts.popitem(last=False)
+        return value
+
+    def count(self, key):
+        return self.counts.get(key, 0)
+
+    def clear(self):
+        self.counts.clear()
+
+    @property
+    def nbytes(self):
+        # rough upper bound: dict slot + int key + int value per entry
+        return self.capacity * 120
+
+
+class VisitCounter(object):
+    """
+    Visit counts of observations with a fixed memory footprint.
+    :param mode: 'cms' (count-min sketch of `width` x `depth` counters) or 'lru' (`capacity` entries)
+    """
+    def __init__(self, mode='cms', width=2 ** 16, depth=4, capacity=2 ** 16):
+        self.mode = mode
+        if mode == 'cms':
+            self.counter = CountMinSketch(width=width, depth=depth)
+        elif mode == 'lru':
+            self.counter = LRUCounter(capacity=capacity)
+        else:
+            raise ValueError('unknown visit counter mode: {}'.format(mode))
+        self.total = 0
+
+    def add(self, obs):
+        """
+        Counts one visit of obs and returns its visit count
+        """
+        self.total += 1
+        return self.counter.add(obs_key(obs))
+
+    def count(self, obs):
+        return self.counter.count(obs_key(obs))
+
+    def novelty_bonus(self, obs, scale=1.0):
+        """
+        Count-based exploration bonus scale / sqrt(n), n >= 1 being the visit count of obs
+        """
+        return scale / np.sqrt(max(1, self.count(obs)))
+
+    def clear(self):
+        self.counter.clear()
+        self.total = 0
+
+    @property
+    def nbytes(self):
+        return self.counter.nbytes
@@ -0,0 +1,107 @@
+"""
+Exact what-if scoring of wall changes, without touching the state.
+
+State.update_score() floods, for each player, the cells reachable from the
+border without crossing the player's own walls; the other non-wall cells are
+enclosed. A player's territory becomes (territory - opponent walls) | enclosed
+and the score is alpha * walls + beta * enclosed castles + gamma * territory.
+
+One WallAnalysis per player answers the effect of any single wall change:
+- building an own wall on a reachable cell c encloses the cells that can
+  only reach the border through c. A DFS from a virtual vertex linked to the
+  border cells finds them (articulation points, Tarjan) together with the
+  number of their cells that are new territory and castles;
+- destroying an own wall at c frees the enclosed regions next to c if c is on
+  the border or next to a reachable cell, else c becomes enclosed too. The
+  enclosed regions are labelled once with their sizes;
+- the opponent only loses (or regains) c itself from their territory.
+Both analyses run as one kernel of src/kernels.py, shared by all candidate cells.
+"""
+import numpy as np
+
+from src import kernels
+
+ORTHOGONAL = ((0, 1), (0, -1), (1, 0), (-1, 0))
+
+
+class WallAnalysis(object):
+    """
+    Connectivity of one player's board, see the module docstring.
+    :param own_walls, opp_walls, territory: layers of the player, castles: castle layer
+    """
+    def __init__(self, own_walls, opp_walls, territory, castles):
+        self.height, self.width = own_walls.shape
+        # territory kept whatever the flood gives
+        self.kept = (territory == 1) & (opp_walls == 0)
+        self.territory = territory == 1
+        self.reachable, self.cut_free, self.cut_castles, self.labels, self.region_free, self.region_castles = \
+            kernels.wall_analysis(own_walls, opp_walls, territory, castles)
+        self.enclosed = self.labels >= 0
+
+    def build(self, x, y):
+        """
+        (territory delta, castle delta) of building an own wall on the empty cell (x, y)
+        """
+        if self.reachable[x, y]:
+            return int(self.cut_free[x, y]), int(self.cut_castles[x, y])
+        # an enclosed cell turns into a wall, it stays territory only if kept
+        return -int(not self.kept[x, y]), 0
+
+    def destroy(self, x, y):
+        """
+        (territory delta, castle delta) of destroying an own wall at (x, y)
+        """
+        height, width = self.height, self.width
+        opened = x == 0 or x == height - 1 or y == 0 or y == width - 1
+        regions = set()
+        for dx, dy in ORTHOGONAL:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < height and 0 <= ny < width:
+                opened |= bool(self.reachable[nx, ny])
+                if self.labels[nx, ny] >= 0:
+                    regions.add(int(self.labels[nx, ny]))
+        if not opened:
+            # the cell joins the enclosed regions around it
+            return int(not self.kept[x, y]), 0
+        return -sum(int(self.region_free[r]) for r in regions), -sum(int(self.region_castles[r]) for r in regions)
+
+    def opponent_wall(self, x, y, built):
+        """
+        Territory delta of the opponent building (built=True) or destroying a wall at (x, y)
+        """
+        if self.enclosed[x, y]:
+            return 0
+        if built:
+            return -int(self.kept[x, y])
+        return int(self.territory[x, y])
+
+
+def wall_flip_deltas(state, cells, player=None, analyses=None):
+    """
+    Exact score changes of both players for flipping each cell, as State.next()
+    does for a Change action of `player` (the current one by default): an
+    empty cell gets a wall of `player`, a wall of either player is destroyed.
+    :param cells: sequence of (x, y)
+    :param analyses: the WallAnalysis of both players, computed if None
+    :return: float array (len(cells), 2), nan for cells outside of the board,
+             on castles or on ponds, where no wall can be built
+    """
+    if player is None:
+        player = state.current_player
+    if analyses is None:
+        analyses = [WallAnalysis(state.walls[p], state.walls[1 - p], state.territories[p], state.castles)
+                     for p in range(2)]
+    deltas = np.full((len(cells), 2), np.nan)
+    for i, (x, y) in enumerate(cells):
+        if not (0 <= x < state.height and 0 <= y < state.width) or state.castles[x, y] or state.ponds[x, y]:
+            continue
+        if state.walls[0, x, y] == 0 and state.walls[1, x, y] == 0:
+            owner, built = player, True
+            territory, castles = analyses[owner].build(x, y)
+        else:
+            owner, built = (0 if state.walls[0, x, y] else 1), False
+            territory, castles = analyses[owner].destroy(x, y)
+        deltas[i, owner] = (state.alpha if built else -state.alpha) + state.beta * castles + \
+            state.gamma * territory
+        deltas[i, 1 - owner] = state.gamma * analyses[1 - owner].opponent_wall(x, y, built)
+    return deltas
@@ -0,0 +1,53 @@
+"""
+Shared fixtures. Run from the repository root: python -m pytest tests
+"""
+import os
+import sys
+import json
+import random
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from src.environment import AgentFighting
+from src.utils import seeded
+
+
+@pytest.fixture
+def configs():
+    with open(os.path.join(ROOT, 'configs', 'map.json')) as f:
+        return json.load(f)
+
+
+def random_game(configs, seed, change_rate=0.6):
+    """
+    Plays a game of random valid actions, wall changes being favoured so the
+    walls and territories build up. Yields the env before the first step and
+    after every step.
+    """
+    with seeded(seed):
+        env = AgentFighting(None, configs, render=False)
+    rng = random.Random(seed)
+    n_moves = len(env.state.move_offsets)
+    yield env
+    while not env.is_terminal():
+        valid = np.flatnonzero(env.state.get_valid_actions())
+        changes = [int(a) for a in valid if a >= n_moves]
+        if changes and rng.random() < change_rate:
+            action = rng.choice(changes)
+        else:
+            action = int(rng.choice(valid)) if len(valid) else env.n_actions - 1
+        env.step(action)
+        yield env
+
+
+@pytest.fixture
+def play(configs):
+    """
+    play(seed) -> random_game() on configs/map.json
+    """
+    return lambda seed, **kwargs: random_game(configs, seed, **kwargs)
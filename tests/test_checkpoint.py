@@ -0,0 +1,72 @@
+import os
+import pickle
+from collections import OrderedDict, defaultdict, namedtuple
+
+import numpy as np
+import pytest
+
+from src.checkpoint import CheckpointWriter, snapshot
+
+Pair = namedtuple('Pair', 'first second')
+
+
+def pickle_dump(state, f):
+    pickle.dump(state, f)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def test_snapshot_copies_containers():
+    weights = np.arange(4.0)
+    state = {'weights': weights, 'counts': defaultdict(list, {1: [2]}), 'pair': Pair([1], 2),
+             'ordered': OrderedDict(a=1), 'items': ([weights], 3)}
+    copy = snapshot(state)
+    weights[:] = -1
+    state['counts'][1].append(3)
+    state['pair'].first.append(2)
+    np.testing.assert_array_equal(copy['weights'], np.arange(4.0))
+    assert copy['counts'].default_factory is list and copy['counts'] == {1: [2]}
+    assert isinstance(copy['pair'], Pair) and copy['pair'] == Pair([1], 2)
+    assert type(copy['ordered']) is OrderedDict
+    np.testing.assert_array_equal(copy['items'][0][0], np.arange(4.0))
+
+
+def test_writes_keep_last_and_best(tmp_path):
+    with CheckpointWriter(str(tmp_path), keep_last=2, serializer=pickle_dump) as writer:
+        for episode in range(4):
+            writer.save({'episode': episode}, episode, is_best=episode == 1)
+    names = sorted(os.listdir(str(tmp_path)))
+    assert names == ['checkpoint-00000002.pth.tar', 'checkpoint-00000003.pth.tar', 'model_best.pth.tar']
+    assert load(str(tmp_path / 'checkpoint-00000003.pth.tar')) == {'episode': 3}
+    # the best model outlives its pruned checkpoint
+    assert load(str(tmp_path / 'model_best.pth.tar')) == {'episode': 1}
+
+
+def test_failed_write_leaves_previous_checkpoint(tmp_path):
+    def failing(state, f):
+        f.write(b'partial')
+        raise RuntimeError('disk full')
+
+    writer = CheckpointWriter(str(tmp_path), serializer=pickle_dump)
+    writer.save({'episode': 0}, 0)
+    writer.flush()
+    writer.serializer = failing
+    writer.save({'episode': 1}, 0)
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    writer.close()
+    # no temp file left, the target still holds the last complete checkpoint
+    assert os.listdir(str(tmp_path)) == ['checkpoint-00000000.pth.tar']
+    assert load(str(tmp_path / 'checkpoint-00000000.pth.tar')) == {'episode': 0}
+
+
+def test_saved_state_is_a_snapshot(tmp_path):
+    weights = np.zeros(3)
+    with CheckpointWriter(str(tmp_path), serializer=pickle_dump) as writer:
+        writer.save({'weights': weights}, 0)
+        # training keeps updating the state while the write is queued
+        weights += 1
+    np.testing.assert_array_equal(load(str(tmp_path / 'checkpoint-00000000.pth.tar'))['weights'], np.zeros(3))
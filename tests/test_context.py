@@ -0,0 +1,50 @@
+"""
+Context maps from incrementally synced summed-area tables against direct region sums
+"""
+import numpy as np
+import pytest
+
+from src.context import CONTEXT_CHANNELS, grid_edges
+
+
+def brute_force_context(state, n, player):
+    opponent = 1 - player
+    layers = [state.agents[player], state.walls[player], state.territories[player],
+              state.agents[opponent], state.walls[opponent], state.territories[opponent],
+              state.castles, state.ponds]
+    rows, cols = grid_edges(state.height, n), grid_edges(state.width, n)
+    # membership of the board rows / columns in the regions, (n, H) and (n, W)
+    row_member = (np.arange(state.height) >= rows[:-1, None]) & (np.arange(state.height) < rows[1:, None])
+    col_member = (np.arange(state.width) >= cols[:-1, None]) & (np.arange(state.width) < cols[1:, None])
+    area = np.maximum(np.outer(row_member.sum(1), col_member.sum(1)), 1)
+    out = np.zeros((len(CONTEXT_CHANNELS), n, n), dtype=np.float32)
+    for c, layer in enumerate(layers):
+        out[c] = row_member.astype(np.int64) @ layer.astype(np.int64) @ col_member.T.astype(np.int64) / area
+    if player == state.current_player:
+        x, y = state.get_curr_agent()
+        out[8, np.flatnonzero(row_member[:, x])[0], np.flatnonzero(col_member[:, y])[0]] = 1
+    return out
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_context_maps(play, seed):
+    scales = (1, 2, 4, 8, 32)
+    for env in play(seed):
+        state = env.state
+        for player in (0, 1):
+            maps = state.get_context(scales, player)
+            for n, got in zip(scales, maps):
+                np.testing.assert_allclose(got, brute_force_context(state, n, player), rtol=1e-6)
+
+
+def test_context_of_clones(play):
+    game = play(2)
+    state = next(game).state
+    state.get_context()
+    clone = state.clone()
+    for env in game:
+        pass
+    # the clone keeps its own tables, the game moved on
+    for got, want in zip(clone.get_context(), [brute_force_context(clone, n, clone.current_player)
+                                               for n in clone.context_scales]):
+        np.testing.assert_allclose(got, want, rtol=1e-6)
@@ -0,0 +1,49 @@
+"""
+Feature planes maintained incrementally by State.next() against planes built from scratch
+"""
+import numpy as np
+import pytest
+
+from src.features import FEATURE_PLANES, FeaturePlanes
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_incremental_planes(play, seed, monkeypatch):
+    rebuilds = []
+    rebuild = FeaturePlanes.rebuild
+    monkeypatch.setattr(FeaturePlanes, 'rebuild', lambda planes, state: rebuilds.append(1) or rebuild(planes, state))
+    first = True
+    for env in play(seed):
+        state = env.state
+        n_rebuilds = len(rebuilds)
+        planes = state.feature_planes()
+        if not first:
+            # wall changes of next() are applied in place, without a rebuild
+            assert len(rebuilds) == n_rebuilds
+        first = False
+        expected = FeaturePlanes(state)
+        np.testing.assert_array_equal(planes.walls, expected.walls)
+        np.testing.assert_array_equal(planes.static, expected.static)
+
+
+@pytest.mark.parametrize('partial', [True, False])
+def test_observation_channels(play, partial):
+    for env in play(0):
+        state = env.state
+        obs = state.get_observation(partial=partial, features=True)
+        n_layers = obs.shape[0] - len(FEATURE_PLANES)
+        expected = np.zeros((len(FEATURE_PLANES), state.height, state.width), dtype=np.int8)
+        FeaturePlanes(state).write(expected, state.current_player)
+        if not partial:
+            np.testing.assert_array_equal(obs[n_layers:], expected)
+            continue
+        # cells of the window inside the board carry the planes of the board cell, -1 outside
+        x, y = state.get_curr_agent()
+        offset_x, offset_y = x - state.obs_range + 1, y - state.obs_range + 1
+        for i in range(obs.shape[1]):
+            for j in range(obs.shape[2]):
+                bx, by = offset_x + i, offset_y + j
+                if 0 <= bx < state.height and 0 <= by < state.width:
+                    np.testing.assert_array_equal(obs[n_layers:, i, j], expected[:, bx, by])
+                else:
+                    assert (obs[n_layers:, i, j] == -1).all()
@@ -0,0 +1,56 @@
+"""
+JIT-compiled kernels against the NumPy fallbacks (the plain loop for the wall analysis)
+"""
+import numpy as np
+import pytest
+
+from src import kernels
+
+numba = pytest.importorskip('numba')
+
+JIT = {name: numba.njit(getattr(kernels, '_{}_loop'.format(name)))
+       for name in ('player_scores', 'valid_action_mask', 'wall_analysis')}
+
+
+def random_boards(seed, n=50):
+    rng = np.random.RandomState(seed)
+    for _ in range(n):
+        height, width = rng.randint(1, 16, size=2)
+        density = rng.uniform(0, 0.6)
+        walls = (rng.rand(2, height, width) < density).astype(np.int8)
+        walls[1] &= 1 - walls[0]
+        territory = (rng.rand(height, width) < 0.3).astype(np.int8)
+        castles = (rng.rand(height, width) < 0.1).astype(np.int8)
+        yield walls, territory, castles
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_player_scores(seed):
+    for walls, territory, castles in random_boards(seed):
+        for player in (0, 1):
+            expected_territory = territory.copy()
+            territory_jit = territory.copy()
+            expected = kernels._player_scores_numpy(walls[player], walls[1 - player], expected_territory, castles)
+            got = JIT['player_scores'](walls[player], walls[1 - player], territory_jit, castles)
+            assert tuple(int(x) for x in got) == expected
+            np.testing.assert_array_equal(territory_jit, expected_territory)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_wall_analysis(seed):
+    for walls, territory, castles in random_boards(seed):
+        expected = kernels._wall_analysis_loop(walls[0], walls[1], territory, castles)
+        got = JIT['wall_analysis'](walls[0], walls[1], territory, castles)
+        for a, b in zip(got, expected):
+            np.testing.assert_array_equal(a, b)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_valid_action_mask(play, seed):
+    for env in play(seed):
+        state = env.state
+        x, y = state.get_curr_agent()
+        for drop_self in (False, True):
+            args = (state.current_player, x, y, state.agents, state.walls, state.castles, state.ponds,
+                    state.occupied_board(), state.move_offsets, state.change_offsets, drop_self)
+            np.testing.assert_array_equal(JIT['valid_action_mask'](*args), kernels._valid_action_mask_numpy(*args))
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from src.recorder import EpisodeRecorder, EpisodeReplayer, pack_board
+
+
+def record_game(play, seed, snapshot_interval):
+    """
+    Records a random game, returns the recorder and the packed board, scalars and scores of every step
+    """
+    recorder = EpisodeRecorder(snapshot_interval=snapshot_interval, seed=seed)
+    expected = []
+    for env in play(seed):
+        state = env.state
+        if recorder.meta is None:
+            env.set_recorder(recorder)
+        expected.append((pack_board(state), (state.current_player, state.agent_current_idx, state.remaining_turns),
+                         np.array(state.scores, dtype=np.float64)))
+    return recorder, expected
+
+
+def assert_frame(frame, expected):
+    board, scalars, scores = expected
+    np.testing.assert_array_equal(frame.board, board)
+    assert (frame.current_player, frame.agent_current_idx, frame.remaining_turns) == scalars
+    np.testing.assert_array_equal(frame.scores, scores)
+
+
+@pytest.mark.parametrize('snapshot_interval', [1, 5, 1000])
+def test_seek_and_iterate(play, snapshot_interval):
+    recorder, expected = record_game(play, 0, snapshot_interval)
+    replayer = recorder.replayer()
+    assert len(replayer) == len(expected)
+    # seeking backwards and forwards rebuilds every frame from its snapshot
+    for step in reversed(range(len(expected))):
+        assert_frame(replayer.frame(step), expected[step])
+    for frame, want in zip(replayer.frames(), expected):
+        assert_frame(frame, want)
+
+
+def test_save_load_round_trip(play, tmp_path):
+    recorder, expected = record_game(play, 1, 7)
+    path = str(tmp_path / 'game.npz')
+    recorder.save(path)
+    replayer = EpisodeReplayer.load(path)
+    assert replayer.meta['seed'] == 1
+    np.testing.assert_array_equal(replayer.castles, recorder.castles)
+    np.testing.assert_array_equal(replayer.actions, recorder.actions)
+    for step in (0, len(expected) // 2, len(expected) - 1):
+        assert_frame(replayer.frame(step), expected[step])
+    with pytest.raises(IndexError):
+        replayer.frame(len(expected))
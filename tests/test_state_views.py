@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+
+def _fields(state):
+    # the fields of a view, computed directly on the state
+    return {
+        'observation': state.get_observation(features=True),
+        'valid_actions': state.get_valid_actions(),
+        'hash_str': state.string_representation(),
+        'scores': np.array(state.scores),
+        'context': state.get_context(),
+    }
+
+
+def _assert_equal(view, expected):
+    for key, value in expected.items():
+        if key == 'context':
+            for got, want in zip(view[key], value):
+                np.testing.assert_array_equal(got, want)
+        elif key == 'hash_str':
+            assert view[key] == value
+        else:
+            np.testing.assert_array_equal(view[key], value)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_views_keep_their_version(play, seed):
+    views = []
+    for env in play(seed):
+        state = env.state
+        # warm caches, so detaching has feature planes and context tables to snapshot
+        state.feature_planes()
+        state.context_tables()
+        views.append((state.get_state(features=True, context=True), _fields(state)))
+    for view, expected in views:
+        _assert_equal(view, expected)
+
+
+def test_view_fields_are_memoized(play):
+    env = next(play(0))
+    view = env.state.get_state()
+    assert view['observation'] is view['observation']
+    assert view['valid_actions'] is view['valid_actions']
@@ -0,0 +1,47 @@
+"""
+What-if wall deltas against flipping the wall on a clone and rescoring it
+"""
+import numpy as np
+import pytest
+
+from src.whatif import wall_flip_deltas
+
+
+def flip_and_score(state, x, y, player):
+    # what State.next() does to the walls for a Change action of player
+    after = state.clone()
+    after.invalidate()
+    if after.walls[0, x, y] == 0 and after.walls[1, x, y] == 0:
+        after.walls[player, x, y] = 1
+    else:
+        after.walls[:, x, y] = 0
+    after.mark_changed('walls')
+    after.update_score()
+    return np.array(after.scores, dtype=float) - np.array(state.scores, dtype=float)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_deltas_of_every_cell(play, seed):
+    for step, env in enumerate(play(seed)):
+        if step % 5:
+            continue
+        state = env.state
+        cells = [(x, y) for x in range(-1, state.height + 1) for y in range(-1, state.width + 1)]
+        for player in (0, 1):
+            deltas = state.wall_flip_deltas(cells, player)
+            for (x, y), delta in zip(cells, deltas):
+                if not (0 <= x < state.height and 0 <= y < state.width) or state.castles[x, y] or state.ponds[x, y]:
+                    assert np.isnan(delta).all()
+                else:
+                    np.testing.assert_array_equal(delta, flip_and_score(state, x, y, player))
+
+
+def test_memoized_analyses_follow_the_state(play):
+    # State.wall_flip_deltas reuses its analyses until walls or territories change
+    for env in play(1):
+        state = env.state
+        cells = [(x, y) for x in range(state.height) for y in range(state.width)]
+        np.testing.assert_array_equal(state.wall_flip_deltas(cells), wall_flip_deltas(state, cells))
+        x, y = state.get_curr_agent()
+        targets = [(x + dx, y + dy) for dx, dy in state.change_offsets]
+        np.testing.assert_array_equal(state.change_action_deltas(), wall_flip_deltas(state, targets))